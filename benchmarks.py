@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of parser, ICM and storage hot paths on the bundled hand history corpus.
+
+usage: python benchmarks.py [--corpus DIR] [--repeat N] [--only parse,properties,icm,import]
+                            [--output FILE] [--compare OLD_FILE]
+
+Results are written as json: {"meta": {...}, "results": {name: {"value": .., "unit": ..}}}
+--compare prints ratio of every result to the same result of the previous run.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+import bulk_import
+import icm
+from hand_storage import split_hands
+from hhparser import HHParser
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BASE_DIR, '10')
+TEST_FILE = os.path.join(BASE_DIR, 'test', '2381044239.txt')
+DEFAULT_OUTPUT = 'bench_results.json'
+SUITES = ['parse', 'properties', 'icm', 'import']
+
+PROPERTIES = [
+    'tid', 'hid', 'datetime', 'bi', 'bounty', 'rake', 'hero', 'hero_cards',
+    'p_actions', 'f_actions', 't_actions', 'r_actions',
+    'p_actions_amounts', 'f_actions_amounts', 't_actions_amounts', 'r_actions_amounts',
+    'p_ai_players', 'f_ai_players', 't_ai_players', 'r_ai_players',
+    'flop', 'turn', 'river', 'pot_list', 'known_cards',
+    'blinds', 'antes', 'blinds_antes', 'uncalled', 'chip_won',
+    'finishes', 'bounty_won', 'prize_won',
+]
+
+
+def load_hands(corpus_dir):
+    hands = []
+    for file in bulk_import.find_files(corpus_dir) + [TEST_FILE]:
+        hands.extend(hand for _, hand in split_hands(file))
+    return hands
+
+
+def best_of(func, repeat):
+    # minimal wall time of repeat runs
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_parse(hands, repeat):
+    res = {}
+    for mode, single_pass in (('regex', False), ('single_pass', True)):
+        def parse():
+            for hand in hands:
+                HHParser(hand, single_pass=single_pass)
+
+        def parse_all():
+            for hand in hands:
+                p = HHParser(hand, single_pass=single_pass)
+                for name in PROPERTIES:
+                    getattr(p, name)
+
+        res[f'parse.{mode}.init'] = {'value': len(hands) / best_of(parse, repeat), 'unit': 'hands/s'}
+        res[f'parse.{mode}.all_properties'] = {'value': len(hands) / best_of(parse_all, repeat), 'unit': 'hands/s'}
+    return res
+
+
+def bench_properties(hands, repeat):
+    #   cost of the first access to every cached property, parser construction excluded
+    res = {}
+    for name in PROPERTIES:
+        best = float('inf')
+        for _ in range(repeat):
+            parsed = [HHParser(hand) for hand in hands]
+            start = time.perf_counter()
+            for p in parsed:
+                getattr(p, name)
+            best = min(best, time.perf_counter() - start)
+        res[f'properties.{name}'] = {'value': best / len(hands) * 1e6, 'unit': 'us/hand'}
+    return res
+
+
+def bench_icm(repeat):
+    res = {}
+    rng = np.random.RandomState(0)
+    prizes = [0.5, 0.3, 0.2]
+    for n in range(2, 10):
+        stacks = rng.randint(500, 5000, n)
+        number = 20
+        t = best_of(lambda: [icm.icm_eq(stacks, prizes) for _ in range(number)], repeat) / number
+        res[f'icm.icm_eq.{n}'] = {'value': t * 1e3, 'unit': 'ms'}
+        t = best_of(lambda: icm.bubble_factors(stacks, prizes), repeat)
+        res[f'icm.bubble_factors.{n}'] = {'value': t * 1e3, 'unit': 'ms'}
+    return res
+
+
+def bench_import(corpus_dir, repeat, workers):
+    res = {}
+    t = float('inf')
+    hands = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hands = len(bulk_import.import_directory(corpus_dir, workers))
+        t = min(t, time.perf_counter() - start)
+    res['import.throughput'] = {'value': hands / t, 'unit': 'hands/s'}
+    # ru_maxrss is in kilobytes on linux, peak of the main process and of the largest worker
+    res['import.peak_rss.main'] = {'value': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 'unit': 'MB'}
+    res['import.peak_rss.worker'] = {
+        'value': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 'unit': 'MB'}
+    return res
+
+
+def bench_import_isolated(corpus_dir, repeat, workers):
+    """
+    import benchmark in a fresh interpreter, peak memory of the main process
+    doesn't include hands held by other suites
+    """
+    code = ('import json, sys, benchmarks; '
+            'print(json.dumps(benchmarks.bench_import(sys.argv[1], int(sys.argv[2]), '
+            'int(sys.argv[3]) if sys.argv[3] != "None" else None)))')
+    out = subprocess.check_output([sys.executable, '-c', code, corpus_dir, str(repeat), str(workers)],
+                                  cwd=BASE_DIR)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(corpus_dir=CORPUS_DIR, repeat=3, suites=SUITES, workers=None):
+    """
+    runs benchmarks
+    :param corpus_dir: directory with hand history files
+    :param repeat: number of runs, the best one is reported
+    :param suites: list of suites from SUITES
+    :param workers: number of processes for import benchmark
+    :return: dict with meta and results
+    """
+    results = {}
+    hands = load_hands(corpus_dir) if {'parse', 'properties'} & set(suites) else []
+    # parser prints removed zero stacks
+    with contextlib.redirect_stdout(io.StringIO()):
+        if 'parse' in suites:
+            results.update(bench_parse(hands, repeat))
+        if 'properties' in suites:
+            results.update(bench_properties(hands, repeat))
+    if 'icm' in suites:
+        results.update(bench_icm(repeat))
+    if 'import' in suites:
+        results.update(bench_import_isolated(corpus_dir, repeat, workers))
+
+    meta = {
+        'datetime': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'hands': len(hands),
+        'repeat': repeat,
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare(new, old):
+    #   prints new / old ratio of every result
+    for name, res in new['results'].items():
+        prev = old['results'].get(name)
+        ratio = f"{res['value'] / prev['value']:.2f}x" if prev and prev['value'] else '-'
+        print(f"{name:45} {res['value']:12.2f} {res['unit']:8} {ratio}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of parser, ICM and storage')
+    parser.add_argument('--corpus', default=CORPUS_DIR, help='directory with hand history files')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the best one is reported')
+    parser.add_argument('--only', default=','.join(SUITES), help='comma separated suites: ' + ','.join(SUITES))
+    parser.add_argument('--workers', type=int, default=None, help='number of processes for import')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='json file with results')
+    parser.add_argument('--compare', default=None, help='json file with previous results')
+    args = parser.parse_args(argv)
+
+    suites = [x for x in args.only.split(',') if x]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f'unknown suites: {",".join(sorted(unknown))}')
+
+    res = run(args.corpus, args.repeat, suites, args.workers)
+    with open(args.output, 'w') as f:
+        json.dump(res, f, indent=2)
+
+    old = {'results': {}}
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+    compare(res, old)
+    return res
+
+
+if __name__ == '__main__':
+    main()
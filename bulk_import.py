@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel import of hand history directories.
+
+Files are parsed in a process pool, big files are split into batches of hands,
+every worker returns compact HandRecord objects.
+
+usage: python bulk_import.py PATH [--workers N] [--quiet] [--cache FILE] [--export DIR [--format npz|parquet]]
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from export import export_hands
+from hand_cache import HandCache
+from hand_record import HandRecord
+from hand_storage import split_hands
+from hhparser import HHParser
+
+logger = logging.getLogger(__name__)
+
+# files bigger than this are split into batches of hands in the main process
+BIG_FILE_SIZE = 16 << 20
+BATCH_HANDS = 2000
+MAX_PENDING_PER_WORKER = 4
+
+
+def parse_hands(hands):
+    """
+    parses hand histories in worker
+    :param hands: list of tuples (offset, hand history)
+    :return: tuple (list of tuples (offset, HandRecord), number of hands failed to parse)
+    """
+    records = []
+    errors = 0
+    for offset, hand in hands:
+        try:
+            records.append((offset, HandRecord.from_parser(HHParser(hand, single_pass=True))))
+        except Exception as e:
+            logger.debug(f'Hand parsing error: {e!r}')
+            errors += 1
+    return records, errors
+
+
+def parse_file(file, offset=0):
+    """
+    parses all hands of the file in worker
+    :param file: path to hand history file
+    :param offset: byte offset to start from
+    :return: tuple (list of tuples (offset, HandRecord), number of hands failed to parse)
+    """
+    return parse_hands(split_hands(file, offset))
+
+
+def find_files(path):
+    return sorted(glob.glob(f'{path}/**/*.txt', recursive=True))
+
+
+def _tasks(files, cache=None):
+    # yields tuples (file, function, arguments) with the work for the pool,
+    # and (file, None, (cached items, stat, offset)) after the last task of every file
+    for file in files:
+        offset = 0
+        cached = []
+        st = None
+        if cache is not None:
+            cached, offset, st = cache.check(file)
+            if offset is None:
+                yield file, None, (cached, None, None)
+                continue
+
+        if os.path.getsize(file) - offset > BIG_FILE_SIZE:
+            batch = []
+            for item in split_hands(file, offset):
+                batch.append(item)
+                if len(batch) >= BATCH_HANDS:
+                    yield file, parse_hands, (batch, )
+                    batch = []
+            if batch:
+                yield file, parse_hands, (batch, )
+        else:
+            yield file, parse_file, (file, offset)
+
+        yield file, None, (cached, st, offset)
+
+
+class _FileResult:
+    # results of a file collected from all its tasks
+    def __init__(self):
+        self.pending = 0
+        self.items = []
+        # (cached items, stat, offset) when all tasks are submitted
+        self.submitted = None
+
+
+def import_directory(path, workers=None, progress=None, cache=None):
+    """
+    parses all hand history files in directory in parallel
+    :param path: directory with hand history files, searched recursively
+    :param workers: number of worker processes, number of cpus if None
+    :param progress: function progress(done, submitted, hands, errors) called after every finished task
+    :param cache: HandCache, only not cached parts of files are parsed if given
+    :return: list of HandRecord sorted by hand id
+    """
+    workers = workers or os.cpu_count() or 1
+    records = []
+    errors = 0
+    done = 0
+    submitted = 0
+    files = {}
+
+    def finish(file):
+        # all tasks of the file are done
+        res = files.pop(file)
+        cached, st, offset = res.submitted
+        # batches of big files may finish in any order
+        res.items.sort(key=lambda x: x[0])
+        if st is not None:
+            cache.update(file, st, offset, res.items)
+        records.extend(record for _, record in cached + res.items)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        tasks = _tasks(find_files(path), cache)
+        while True:
+            # limit number of tasks in flight, so batches of big files are not all read at once
+            for file, func, args in tasks:
+                res = files.setdefault(file, _FileResult())
+                if func is None:
+                    res.submitted = args
+                    if not res.pending:
+                        finish(file)
+                    continue
+                pending[pool.submit(func, *args)] = file
+                res.pending += 1
+                submitted += 1
+                if len(pending) >= workers * MAX_PENDING_PER_WORKER:
+                    break
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                file = pending.pop(future)
+                items, err = future.result()
+                res = files[file]
+                res.items.extend(items)
+                res.pending -= 1
+                errors += err
+                done += 1
+                if not res.pending and res.submitted is not None:
+                    finish(file)
+                if progress:
+                    progress(done, submitted, len(records), errors)
+
+    records.sort(key=lambda x: x.hid)
+    return records
+
+
+def _print_progress(done, total, hands, errors):
+    print(f'\r{done}/{total} tasks, {hands} hands, {errors} errors', end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parse hand history directory in parallel')
+    parser.add_argument('path', help='directory with hand history files')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    parser.add_argument('--cache', default=None, help='path to sqlite cache of parsed hands')
+    parser.add_argument('--export', default=None, help='directory to export hands in columnar format')
+    parser.add_argument('--format', default='npz', choices=['npz', 'parquet'], help='export format')
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    cache = HandCache(args.cache) if args.cache else None
+    records = import_directory(args.path, args.workers, None if args.quiet else _print_progress, cache)
+    elapsed = time.time() - start
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f'{len(records)} hands imported in {elapsed:.2f} s ({len(records) / max(elapsed, 1e-9):.0f} hands/s)')
+    if args.export:
+        export_hands(records, args.export, args.format)
+        print(f'{len(records)} hands exported to {args.export}')
+    return records
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Directory watchers reporting file events.
+
+InotifyWatcher uses inotify through inotify_simple, PollingWatcher scans
+the directory tree with os.scandir and compares mtime and size.
+Both watch directories recursively and yield tuples (event, path), where
+event is CREATE, MODIFY or CLOSE_WRITE.
+Files moved into watched directories are reported as CREATE followed by CLOSE_WRITE.
+Polling watcher reports CLOSE_WRITE when a changed file stays unchanged for one interval.
+"""
+import logging
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+CREATE = 'create'
+MODIFY = 'modify'
+CLOSE_WRITE = 'close_write'
+
+POLL_INTERVAL = 0.5
+
+
+def scan(path, recursive=True):
+    # returns dict {file path: (mtime, size)} of all files in directory tree
+    res = {}
+    dirs = [path]
+    while dirs:
+        d = dirs.pop()
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                dirs.append(entry.path)
+                        elif entry.is_file():
+                            st = entry.stat()
+                            res[entry.path] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.error(f'Directory scan error: {e}')
+    return res
+
+
+class PollingWatcher:
+
+    def __init__(self, path, recursive=True, interval=POLL_INTERVAL):
+        self.path = path
+        self.recursive = recursive
+        self.interval = interval
+        self._files = scan(path, recursive)
+        # files changed since the last scan
+        self._changed = set()
+
+    def poll(self):
+        """
+        compares directory with the previous scan
+        :return: list of tuples (event, path)
+        """
+        events = []
+        current = scan(self.path, self.recursive)
+        for file, state in current.items():
+            prev = self._files.get(file)
+            if prev is None:
+                events.append((CREATE, file))
+                self._changed.add(file)
+            elif prev != state:
+                events.append((MODIFY, file))
+                self._changed.add(file)
+            elif file in self._changed:
+                # file didn't change since the last scan, writing is finished
+                events.append((CLOSE_WRITE, file))
+                self._changed.discard(file)
+        self._changed &= set(current)
+        self._files = current
+        return events
+
+    def events(self):
+        # yields events forever
+        while True:
+            start = time.monotonic()
+            yield from self.poll()
+            time.sleep(max(self.interval - (time.monotonic() - start), 0))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+
+    def __init__(self, path, recursive=True):
+        if INotify is None:
+            raise ImportError('inotify_simple is required for InotifyWatcher')
+        self.path = path
+        self.recursive = recursive
+        self._inotify = INotify()
+        self._mask = (flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO
+                      | flags.DELETE_SELF | flags.MOVE_SELF)
+        self._dirs = {}
+        self._add_dir(path)
+
+    def _add_dir(self, path):
+        # watches directory and its subdirectories, returns files found in them
+        files = []
+        dirs = [path]
+        while dirs:
+            d = dirs.pop()
+            try:
+                wd = self._inotify.add_watch(d, self._mask)
+            except OSError as e:
+                logger.error(f'Watch error: {e}')
+                continue
+            self._dirs[wd] = d
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive:
+                                dirs.append(entry.path)
+                        elif entry.is_file():
+                            files.append(entry.path)
+            except OSError as e:
+                logger.error(f'Directory scan error: {e}')
+        return files
+
+    def read(self, timeout=None):
+        """
+        waits for events
+        :param timeout: seconds, forever if None
+        :return: list of tuples (event, path)
+        """
+        events = []
+        for ev in self._inotify.read(timeout=None if timeout is None else int(timeout * 1000)):
+            if ev.mask & flags.Q_OVERFLOW:
+                # events were lost, report all files as modified
+                logger.error('Inotify queue overflow')
+                events.extend((MODIFY, x) for x in scan(self.path, self.recursive))
+                continue
+            if ev.mask & flags.IGNORED:
+                self._dirs.pop(ev.wd, None)
+                continue
+            d = self._dirs.get(ev.wd)
+            if d is None or not ev.name:
+                continue
+            file = os.path.join(d, ev.name)
+            if ev.mask & flags.ISDIR:
+                if self.recursive and ev.mask & (flags.CREATE | flags.MOVED_TO):
+                    # files could be written before the watch was added
+                    for x in self._add_dir(file):
+                        events.extend([(CREATE, x), (CLOSE_WRITE, x)])
+                continue
+            if ev.mask & flags.CREATE:
+                events.append((CREATE, file))
+            if ev.mask & flags.MOVED_TO:
+                # file moved into the directory is written completely, there are no write events
+                events.extend([(CREATE, file), (CLOSE_WRITE, file)])
+            if ev.mask & flags.MODIFY:
+                events.append((MODIFY, file))
+            if ev.mask & flags.CLOSE_WRITE:
+                events.append((CLOSE_WRITE, file))
+        return events
+
+    def events(self):
+        # yields events forever
+        while True:
+            yield from self.read()
+
+    def close(self):
+        self._inotify.close()
+
+
+def create_watcher(path, recursive=True, interval=POLL_INTERVAL, polling=False):
+    """
+    inotify watcher if available, polling watcher otherwise
+    :param path: directory to watch
+    :param recursive: watch subdirectories
+    :param interval: polling interval in seconds
+    :param polling: always use polling, inotify doesn't see changes made by other hosts on network shares
+    """
+    if INotify is not None and not polling:
+        try:
+            return InotifyWatcher(path, recursive)
+        except OSError as e:
+            # e.g. network shares or inotify watch limit
+            logger.error(f'Inotify is not available, polling is used: {e}')
+    return PollingWatcher(path, recursive, interval)
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar export of parsed hands.
+
+Stream of HandRecord is written as tables:
+hands, seats, actions, showdown, results
+every table is a set of columns, rows are written in groups of row_group_size hands.
+npz format: directory with part-NNNNN.npz files, array names are 'table.column'
+parquet format: directory with table.parquet files, requires pyarrow
+"""
+import glob
+import os
+from datetime import datetime
+
+import numpy as np
+
+from hand_record import HandRecord, STREETS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ROW_GROUP_SIZE = 10000
+
+# table -> list of (column, numpy dtype)
+TABLES = {
+    'hands': [
+        ('hid', 'int64'), ('tid', 'int64'), ('datetime', 'datetime64[s]'),
+        ('bi', 'float64'), ('bounty', 'float64'), ('rake', 'float64'),
+        ('sb', 'int64'), ('bb', 'int64'), ('players', 'int8'), ('hero', 'int8'),
+        ('hero_cards', 'U'), ('board', 'U'),
+    ],
+    'seats': [
+        ('hid', 'int64'), ('seat', 'int8'), ('player', 'U'), ('stack', 'int64'),
+        ('posts', 'int64'), ('preflop_order', 'int8'),
+    ],
+    'actions': [
+        ('hid', 'int64'), ('street', 'int8'), ('seq', 'int16'), ('seat', 'int8'),
+        ('action', 'int8'), ('amount', 'int64'),
+    ],
+    'showdown': [
+        ('hid', 'int64'), ('seat', 'int8'), ('cards', 'U'),
+    ],
+    'results': [
+        ('hid', 'int64'), ('seat', 'int8'), ('chip_won', 'int64'), ('uncalled', 'int64'),
+        ('finish', 'int16'), ('bounty_won', 'float64'), ('prize_won', 'float64'),
+    ],
+}
+
+
+def _as_dict(pairs):
+    return dict(pairs) if pairs else {}
+
+
+class ColumnarExporter:
+    """
+    usage:
+    with ColumnarExporter('out', 'npz') as exporter:
+        for record in records:
+            exporter.add(record)
+    """
+
+    def __init__(self, path, format='npz', row_group_size=ROW_GROUP_SIZE):
+        if format not in ('npz', 'parquet'):
+            raise ValueError(f'Unknown export format: {format}')
+        if format == 'parquet' and pyarrow is None:
+            raise ImportError('pyarrow is required for parquet export')
+
+        self.path = path
+        self.format = format
+        self.row_group_size = row_group_size
+        self.hands = 0
+        self._part = 0
+        self._writers = {}
+        self._buffered = 0
+        self._columns = {}
+        self._clear()
+        os.makedirs(path, exist_ok=True)
+        if format == 'npz':
+            # parts of the previous export would be read by load_npz, parquet files are overwritten
+            for file in glob.glob(os.path.join(path, 'part-*.npz')):
+                os.remove(file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _clear(self):
+        self._columns = {table: {col: [] for col, _ in columns} for table, columns in TABLES.items()}
+        self._buffered = 0
+
+    def _append(self, table, *values):
+        for (col, _), value in zip(TABLES[table], values):
+            self._columns[table][col].append(value)
+
+    def add(self, record):
+        """
+        adds hand to the current row group
+        :param record: HandRecord or HHParser
+        """
+        if not isinstance(record, HandRecord):
+            record = HandRecord.from_parser(record)
+        hid = record.hid
+        dt = record.datetime if isinstance(record.datetime, datetime) else None
+
+        self._append('hands', hid, record.tid, dt, record.bi, record.bounty, record.rake,
+                     record.sb, record.bb, len(record.players), record.hero,
+                     record.hero_cards or '', record.board or '')
+
+        order = {seat: n for n, seat in enumerate(record.preflop_order)}
+        for seat, player in enumerate(record.players):
+            self._append('seats', hid, seat, player, record.stacks[seat], record.posts[seat], order.get(seat, -1))
+
+        for street in range(len(STREETS)):
+            start = record.street_index[street]
+            for seq, n in enumerate(range(start, record.street_index[street + 1])):
+                self._append('actions', hid, street, seq, record.actors[n], record.actions[n], record.amounts[n])
+
+        for seat, cards in _as_dict(record.known_cards).items():
+            self._append('showdown', hid, seat, cards)
+
+        chip_won = _as_dict(record.chip_won)
+        uncalled = _as_dict(record.uncalled)
+        finishes = _as_dict(record.finishes)
+        bounty_won = _as_dict(record.bounty_won)
+        prize_won = _as_dict(record.prize_won)
+        for seat in sorted(set(chip_won) | set(uncalled) | set(finishes) | set(bounty_won) | set(prize_won)):
+            self._append('results', hid, seat,
+                         sum(chip_won.get(seat, ())), uncalled.get(seat, 0), finishes.get(seat) or 0,
+                         bounty_won.get(seat, 0), prize_won.get(seat, 0))
+
+        self.hands += 1
+        self._buffered += 1
+        if self._buffered >= self.row_group_size:
+            self.flush()
+
+    def _arrays(self, table):
+        res = {}
+        for col, dtype in TABLES[table]:
+            values = self._columns[table][col]
+            if dtype == 'U':
+                res[col] = np.array(values, dtype=str) if values else np.array([], dtype='U1')
+            elif dtype.startswith('datetime64'):
+                res[col] = np.array([np.datetime64(x) if x else np.datetime64('NaT') for x in values], dtype=dtype)
+            else:
+                res[col] = np.array(values, dtype=dtype)
+        return res
+
+    def flush(self):
+        #   writes buffered hands as one row group
+        if not self._buffered:
+            return
+
+        if self.format == 'npz':
+            arrays = {f'{table}.{col}': a for table in TABLES for col, a in self._arrays(table).items()}
+            np.savez(os.path.join(self.path, f'part-{self._part:05d}.npz'), **arrays)
+        else:
+            for table in TABLES:
+                batch = pyarrow.table(self._arrays(table))
+                writer = self._writers.get(table)
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(os.path.join(self.path, f'{table}.parquet'), batch.schema)
+                    self._writers[table] = writer
+                writer.write_table(batch)
+
+        self._part += 1
+        self._clear()
+
+    def close(self):
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+def export_hands(records, path, format='npz', row_group_size=ROW_GROUP_SIZE):
+    """
+    writes hands to columnar files
+    :param records: iterable of HandRecord or HHParser
+    :param path: output directory
+    :param format: 'npz' or 'parquet'
+    :param row_group_size: number of hands in a row group
+    :return: number of hands written
+    """
+    with ColumnarExporter(path, format, row_group_size) as exporter:
+        for record in records:
+            exporter.add(record)
+    return exporter.hands
+
+
+def load_npz(path):
+    """
+    reads all row groups of npz export
+    :param path: export directory
+    :return: dict {table: {column: np.array}}
+    """
+    parts = {table: {col: [] for col, _ in columns} for table, columns in TABLES.items()}
+    for file in sorted(glob.glob(os.path.join(path, 'part-*.npz'))):
+        with np.load(file) as data:
+            for key in data.files:
+                table, col = key.split('.', 1)
+                parts[table][col].append(data[key])
+
+    res = {}
+    for table, columns in TABLES.items():
+        res[table] = {}
+        for col, dtype in columns:
+            arrays = parts[table][col]
+            res[table][col] = np.concatenate(arrays) if arrays else np.array([], dtype='U1' if dtype == 'U' else dtype)
+    return res
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of parsed hands.
+
+Hands are stored as pickled HandRecord objects in SQLite keyed by file path and
+byte offset of the hand. A file is served from the cache while its size and
+mtime are unchanged, if the file only grew, hands are parsed from the last
+cached hand on, any other change invalidates all hands of the file.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+
+DEFAULT_PATH = os.path.expanduser('~/.hrcauto_cache.sqlite')
+# size of the file tail used to check that the file was only appended
+TAIL_SIZE = 4096
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    tail_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hands (
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    hid INTEGER NOT NULL,
+    record BLOB NOT NULL,
+    PRIMARY KEY (path, offset)
+);
+CREATE INDEX IF NOT EXISTS hands_hid ON hands (hid);
+'''
+
+
+def _tail_hash(file, size):
+    # hash of the last TAIL_SIZE bytes before size
+    with open(file, 'rb') as f:
+        f.seek(max(size - TAIL_SIZE, 0))
+        return hashlib.sha1(f.read(min(size, TAIL_SIZE))).hexdigest()
+
+
+class HandCache:
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def check(self, file):
+        """
+        finds out which part of the file is cached
+        :param file: path to hand history file
+        :return: tuple (list of (offset, HandRecord) from cache,
+            offset to parse the file from or None if the file is fully cached,
+            os.stat_result of the file to pass to update)
+        """
+        file = os.path.abspath(file)
+        st = os.stat(file)
+        row = self.conn.execute('SELECT size, mtime, tail_hash FROM files WHERE path = ?', (file,)).fetchone()
+        if row is None:
+            return [], 0, st
+
+        size, mtime, tail_hash = row
+        if size == st.st_size and mtime == st.st_mtime_ns:
+            return self._records(file), None, st
+
+        if st.st_size > size and _tail_hash(file, size) == tail_hash:
+            # file was appended, the last cached hand could be incomplete so it is parsed again
+            records = self._records(file)
+            if records:
+                offset, _ = records.pop()
+            else:
+                offset = 0
+            return records, offset, st
+
+        self.invalidate(file)
+        return [], 0, st
+
+    def update(self, file, st, offset, items):
+        """
+        saves hands parsed from offset, hands cached after offset are replaced
+        :param file: path to hand history file
+        :param st: os.stat_result returned by check before parsing
+        :param offset: offset parsing started from
+        :param items: list of tuples (offset, HandRecord)
+        """
+        file = os.path.abspath(file)
+        with self.conn:
+            self.conn.execute('DELETE FROM hands WHERE path = ? AND offset >= ?', (file, offset))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO hands (path, offset, hid, record) VALUES (?, ?, ?, ?)',
+                ((file, off, record.hid, pickle.dumps(record, pickle.HIGHEST_PROTOCOL)) for off, record in items))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO files (path, size, mtime, tail_hash) VALUES (?, ?, ?, ?)',
+                (file, st.st_size, st.st_mtime_ns, _tail_hash(file, st.st_size)))
+
+    def invalidate(self, file):
+        file = os.path.abspath(file)
+        with self.conn:
+            self.conn.execute('DELETE FROM hands WHERE path = ?', (file,))
+            self.conn.execute('DELETE FROM files WHERE path = ?', (file,))
+
+    def read(self, file, parse):
+        """
+        returns hands of the file parsing only the part which is not cached
+        :param file: path to hand history file
+        :param parse: function parse(file, offset) -> tuple (list of tuples (offset, HandRecord), number of errors)
+            like bulk_import.parse_file
+        :return: list of HandRecord
+        """
+        records, offset, st = self.check(file)
+        if offset is not None:
+            items, errors = parse(file, offset)
+            self.update(file, st, offset, items)
+            records.extend(items)
+        return [record for _, record in records]
+
+    def _records(self, file):
+        cur = self.conn.execute('SELECT offset, record FROM hands WHERE path = ? ORDER BY offset', (file,))
+        return [(offset, pickle.loads(record)) for offset, record in cur]
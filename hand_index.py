@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent index of hands processed by watcher.
+
+Every hand is stored by hand id with its status (queued, done, failed, skipped),
+path of HRC result, times of queueing and finishing and hero EV, so hands
+already calculated are skipped after restart.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.expanduser('~/.hrcauto_index.sqlite')
+
+QUEUED = 'queued'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+HAND_ID_REGEX = re.compile(r'Hand #(\d+)')
+TID_REGEX = re.compile(r'Tournament #(\d+)')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hands (
+    hid INTEGER PRIMARY KEY,
+    tid INTEGER,
+    status TEXT NOT NULL,
+    result_path TEXT,
+    queued_at REAL,
+    finished_at REAL,
+    ev REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS hands_status ON hands (status);
+'''
+
+
+def hand_ids(history):
+    """
+    reads ids from the header of hand history without parsing the hand
+    :return: tuple (hand id, tournament id), None if not found
+    """
+    hid = HAND_ID_REGEX.search(history)
+    tid = TID_REGEX.search(history)
+    return int(hid[1]) if hid else None, int(tid[1]) if tid else None
+
+
+class HandIndex:
+    """
+    thread safe, watcher checks hands before queueing and updates them after calculation
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # hands queued before are requeued, they were not finished before restart
+        self._started = time.time()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def status(self, hid):
+        with self._lock:
+            row = self.conn.execute('SELECT status FROM hands WHERE hid = ?', (int(hid),)).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, hid):
+        # done or not needed
+        return self.status(hid) in (DONE, SKIPPED)
+
+    def get(self, hid):
+        """
+        :return: dict with all fields of the hand or None
+        """
+        with self._lock:
+            cur = self.conn.execute('SELECT * FROM hands WHERE hid = ?', (int(hid),))
+            row = cur.fetchone()
+            return dict(zip([x[0] for x in cur.description], row)) if row else None
+
+    def queue(self, hid, tid=None):
+        """
+        marks hand as queued unless it is already done or queued since start
+        :return: True if hand should be calculated
+        """
+        with self._lock, self.conn:
+            row = self.conn.execute('SELECT status, queued_at FROM hands WHERE hid = ?', (int(hid),)).fetchone()
+            if row and (row[0] in (DONE, SKIPPED) or row[0] == QUEUED and row[1] >= self._started):
+                return False
+            self.conn.execute(
+                'INSERT OR REPLACE INTO hands (hid, tid, status, queued_at) VALUES (?, ?, ?, ?)',
+                (int(hid), tid, QUEUED, time.time()))
+            return True
+
+    def skip(self, hid, tid=None):
+        # hand doesn't need calculation
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO hands (hid, tid, status, finished_at) VALUES (?, ?, ?, ?)',
+                (int(hid), tid, SKIPPED, time.time()))
+
+    def done(self, hid, result_path, ev=None):
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE hands SET status = ?, result_path = ?, finished_at = ?, ev = ?, error = NULL WHERE hid = ?',
+                (DONE, result_path, time.time(), ev, int(hid)))
+
+    def failed(self, hid, error):
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE hands SET status = ?, finished_at = ?, error = ? WHERE hid = ?',
+                (FAILED, time.time(), str(error), int(hid)))
+
+    def checkpoint(self):
+        """
+        time after which hands could be missed: the oldest hand queued but not finished
+        or the last queued hand if all hands are finished
+        :return: unix time or None if index is empty
+        """
+        with self._lock:
+            pending, last = self.conn.execute(
+                'SELECT MIN(CASE WHEN status = ? THEN queued_at END), MAX(queued_at) FROM hands',
+                (QUEUED, )).fetchone()
+        return pending if pending is not None else last
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Compact immutable representation of a parsed hand.
+
+HandRecord keeps only extracted fields: players are interned strings referenced
+by index, actions of all streets are stored in flat integer arrays.
+It is built from HHParser and is meant to be held in memory in bulk.
+"""
+import sys
+from array import array
+
+STREETS = ('preflop', 'flop', 'turn', 'river')
+
+# action letters used by HHParser and their integer codes
+ACTION_CODES = {'f': 0, 'x': 1, 'c': 2, 'b': 3, 'r': 4}
+ACTION_LETTERS = {v: k for k, v in ACTION_CODES.items()}
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+class HandRecord:
+    """
+    players - tuple of interned player names, other fields refer to players by index in it
+    stacks, posts - stack and blinds + antes of every player
+    preflop_order - indices of players in preflop order from UTG to BB
+    actors, actions, amounts - actions of all streets in order they were made,
+        street_index[i]:street_index[i + 1] - slice with actions of STREETS[i]
+    known_cards, chip_won, uncalled, finishes, bounty_won, prize_won - tuples of (player index, value) or None
+    """
+    __slots__ = (
+        'tid', 'hid', 'datetime', 'bi', 'bounty', 'rake', 'sb', 'bb',
+        'players', 'stacks', 'posts', 'preflop_order', 'hero', 'hero_cards',
+        'actors', 'actions', 'amounts', 'street_index', 'board',
+        'known_cards', 'chip_won', 'uncalled', 'finishes', 'bounty_won', 'prize_won',
+    )
+
+    def __init__(self, *args):
+        if len(args) != len(self.__slots__):
+            raise TypeError(f'HandRecord expects {len(self.__slots__)} fields, got {len(args)}')
+        for name, value in zip(self.__slots__, args):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('HandRecord is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('HandRecord is immutable')
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, x) for x in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, HandRecord):
+            return NotImplemented
+        return all(getattr(self, x) == getattr(other, x) for x in self.__slots__)
+
+    def __str__(self):
+        return f"Hand: #{self.hid} Tournament: #{self.tid} ${self.bi} [{self.datetime}]"
+
+    @classmethod
+    def from_parser(cls, parsed):
+        """
+        builds record from HHParser
+        :param parsed: HHParser instance
+        :return: HandRecord
+        """
+        players = tuple(_intern(x) for x in parsed.players)
+        index = {x: i for i, x in enumerate(players)}
+
+        def pairs(d):
+            # {player: value} -> ((player index, value), ...) or None
+            if not d:
+                return None
+            return tuple((index.get(k, -1), _intern(v) if isinstance(v, str) else v) for k, v in d.items())
+
+        actors = array('b')
+        actions = array('b')
+        amounts = array('l')
+        street_index = array('H', [0])
+        for street in STREETS:
+            for player, action, amount in parsed.actions_sequence(street):
+                actors.append(index.get(player, -1))
+                actions.append(ACTION_CODES[action])
+                amounts.append(amount)
+            street_index.append(len(actions))
+
+        blinds_antes = parsed.blinds_antes
+        board = ' '.join(x for x in (parsed.flop, parsed.turn, parsed.river) if x) or None
+        hero = parsed.hero
+
+        return cls(
+            int(parsed.tid) if parsed.tid else 0,
+            int(parsed.hid) if parsed.hid else 0,
+            parsed.datetime,
+            parsed.bi,
+            parsed.bounty,
+            parsed.rake,
+            parsed.sb,
+            parsed.bb,
+            players,
+            array('l', (int(x) for x in parsed.stack_list())),
+            array('l', (blinds_antes.get(x, 0) for x in players)),
+            array('b', (index[x] for x in parsed.preflop_order)),
+            index.get(hero, -1),
+            _intern(parsed.hero_cards) if parsed.hero_cards else None,
+            actors,
+            actions,
+            amounts,
+            street_index,
+            board,
+            pairs(parsed.known_cards),
+            pairs({k: tuple(v) for k, v in parsed.chip_won.items()}),
+            pairs(parsed.uncalled),
+            pairs(parsed.finishes),
+            pairs(parsed.bounty_won),
+            pairs(parsed.prize_won),
+        )
+
+    @property
+    def hero_name(self):
+        return self.players[self.hero] if self.hero >= 0 else None
+
+    def street_actions(self, street):
+        """
+        actions of the street in the order they were made
+        :param street: preflop, flop, turn or river
+        :return: list of tuples (player, action letter, amount)
+        """
+        i = STREETS.index(street)
+        res = []
+        for n in range(self.street_index[i], self.street_index[i + 1]):
+            actor = self.actors[n]
+            res.append((self.players[actor] if actor >= 0 else None,
+                        ACTION_LETTERS[self.actions[n]],
+                        self.amounts[n]))
+        return res
+
+    def actions_dict(self, street):
+        #   returns dict {player: [actions]} same as HHParser.p_actions for preflop
+        res = {}
+        for player, action, _ in self.street_actions(street):
+            res.setdefault(player, []).append(action)
+        return res
@@ -4,41 +4,442 @@ Created on Fri Jul 13 00:33:55 2018
 
 @author: user
 """
+import csv
 import glob
+import io
+import json
+import logging
 import os
+import re
+import select
+import time
+import uuid
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+
+from hhparser import TournamentSummary
+
+logger = logging.getLogger(__name__)
+
+# beginning of every hand history, hand starts at the beginning of the line
+HAND_START_REGEX = re.compile(rb'^PokerStars (?:[^\r\n#]* )?Hand #', re.M)
+BOM = b'\xef\xbb\xbf'
+CHUNK_SIZE = 1 << 20
+
+# tables of parsed hands and HRC results written by HandStoragePgsql.write_results, hid is the primary key
+RESULT_TABLES = {
+    'hrc_hands': [
+        ('hid', 'bigint'), ('tid', 'bigint'), ('date_played', 'timestamp'), ('bi', 'numeric'),
+        ('bounty', 'numeric'), ('players', 'smallint'), ('hero', 'text'), ('hero_cards', 'text'),
+        ('stacks', 'jsonb'), ('preflop_order', 'jsonb'),
+    ],
+    'hrc_results': [
+        ('hid', 'bigint'), ('hand', 'text'), ('strategy', 'text'), ('ev', 'double precision'),
+        ('ranges', 'jsonb'), ('result_path', 'text'),
+    ],
+}
+
+
+# channel notified with hh_id of every new hand by trigger of HandStoragePgsql.install_trigger
+NOTIFY_CHANNEL = 'hrcauto_new_hand'
+NOTIFY_TRIGGER = f'''
+CREATE OR REPLACE FUNCTION hrcauto_notify_hand() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{NOTIFY_CHANNEL}', NEW.hh_id::text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS hrcauto_new_hand ON handhistory;
+CREATE TRIGGER hrcauto_new_hand AFTER INSERT ON handhistory
+    FOR EACH ROW EXECUTE PROCEDURE hrcauto_notify_hand();
+'''
+# seconds between checks of new hands without notifications
+POLL_INTERVAL = 5.0
+# hh_id range below the last read hand checked again for hands committed late
+RECHECK_IDS = 1000
+
+
+def _json(value):
+    return None if value is None else json.dumps(value, default=str)
+
+
+def hand_row(parsed_hand):
+    """
+    row of hrc_hands table
+    :param parsed_hand: HHParser
+    """
+    return (int(parsed_hand.hid), int(parsed_hand.tid), parsed_hand.datetime, parsed_hand.bi, parsed_hand.bounty,
+            len(parsed_hand.players), parsed_hand.hero, parsed_hand.hero_cards,
+            _json(parsed_hand.stacks()), _json(list(parsed_hand.preflop_order)))
+
+
+def result_row(parsed_hand, hero_ev, ranges, result_path):
+    """
+    row of hrc_results table
+    :param hero_ev: tuple (hand, strategy, ev) returned by watcher.get_hero_ev or None
+    :param ranges: ranges returned by watcher.get_ranges
+    :param result_path: path to HRC html output
+    """
+    hand, strategy, ev = hero_ev if hero_ev else (None, None, None)
+    return int(parsed_hand.hid), hand, strategy, ev, _json(ranges), result_path
+
+
+def split_hands(file, offset=0, chunk_size=CHUNK_SIZE, encoding='utf-8', complete_only=False):
+    """
+    reads hand histories from file by chunks, memory usage doesn't depend on the file size
+    hands are detected by PokerStars header, text before the first header is skipped
+    :param file: path to hand history file
+    :param offset: byte offset to start reading from, should be a beginning of the hand
+    :param chunk_size: size of chunk read at once
+    :param encoding: encoding of file
+    :param complete_only: skip the last hand if it is not followed by a blank line, it could be still written
+    :return: generator of tuples (byte offset of the hand in file, hand history with \\n line endings)
+    """
+    def decode(data):
+        return data.decode(encoding, errors='replace').replace('\r\n', '\n').strip()
+
+    with open(file, 'rb') as f:
+        buf = b''
+        buf_offset = offset  # file offset of buf[0]
+        if offset == 0 and f.read(len(BOM)) == BOM:
+            buf_offset = len(BOM)
+        else:
+            f.seek(offset)
+
+        start = None  # position of the current hand in buf
+        search_from = 0
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            buf += chunk
+
+            for m in HAND_START_REGEX.finditer(buf, search_from):
+                if start is not None:
+                    yield buf_offset + start, decode(buf[start:m.start()])
+                start = m.start()
+
+            # keep only the current hand, or the last line if no hand started yet
+            keep = buf.rfind(b'\n') + 1 if start is None else start
+            buf = buf[keep:]
+            buf_offset += keep
+            # header may be split between chunks, search again from the beginning of the last line
+            search_from = buf.rfind(b'\n') + 1
+            if start is not None:
+                start = 0
+                search_from = max(search_from, 1)
+
+        if start is not None:
+            hand = buf[start:]
+            if not complete_only or hand[len(hand.rstrip()):].count(b'\n') >= 2:
+                yield buf_offset + start, decode(hand)
+
+
+class HandTail:
+    """
+    follows growing hand history files,
+    every read returns only complete hands appended since the previous read
+    """
+    # size of the beginning of the last read hand used to check that file wasn't rewritten
+    SIGNATURE_SIZE = 64
+
+    def __init__(self):
+        # path -> (device, inode, offset to read from, offset of the last read hand, signature)
+        self._files = {}
+
+    @classmethod
+    def _signature(cls, file, offset):
+        with open(file, 'rb') as f:
+            f.seek(offset)
+            return f.read(cls.SIGNATURE_SIZE)
+
+    def seek(self, file, offset=None):
+        """
+        sets position to read file from, hands before it are skipped
+        :param offset: byte offset, end of file if None
+        """
+        st = os.stat(file)
+        self._files[file] = (st.st_dev, st.st_ino, st.st_size if offset is None else offset, None, b'')
+
+    def forget(self, file):
+        self._files.pop(file, None)
+
+    def read(self, file, final=False):
+        """
+        reads hands appended since the previous read,
+        file is read from the beginning if it was truncated or replaced
+        :param file: path to hand history file
+        :param final: file is completely written, the last hand is read even if it is not followed by a blank line
+        :return: list of tuples (offset, hand history)
+        """
+        st = os.stat(file)
+        offset, last = 0, None
+        state = self._files.get(file)
+        if state is not None:
+            dev, ino, offset, last, signature = state
+            if ((dev, ino) != (st.st_dev, st.st_ino) or st.st_size < offset
+                    or (last is not None and self._signature(file, last) != signature)):
+                # file was rotated or truncated
+                offset, last = 0, None
+
+        res = []
+        for off, hand in split_hands(file, offset, complete_only=not final):
+            # the last read hand is read again, it is the position to continue from
+            if off != last:
+                res.append((off, hand))
+
+        if res:
+            last = res[-1][0]
+        if last is not None:
+            offset = last
+            self._files[file] = (st.st_dev, st.st_ino, offset, last, self._signature(file, last))
+        else:
+            self._files[file] = (st.st_dev, st.st_ino, offset, None, b'')
+        return res
+
+
+class FollowPosition:
+    """
+    position of HandStoragePgsql.follow_hands: the last read hh_id and ids of the recheck range already read
+    """
+    __slots__ = ('last_id', 'seen')
+
+    def __init__(self, last_id=None, seen=None):
+        self.last_id = last_id
+        self.seen = seen
 
 
 class HandStoragePgsql():
-    def __init__(self, dbname, user, host, port, pwd):
+    # columns of handhistory table which can be read
+    HAND_COLUMNS = ('hh_id', 'date_played', 'room_id', 'gamenumber', 'hh')
+    # rows fetched from server at once
+    ITERSIZE = 2000
+    # tournament ids per query of read_summaries
+    SUMMARY_BATCH = 1000
+
+    def __init__(self, dbname, user, host, port, pwd, minconn=1, maxconn=4):
+        """
+        thread safe, every call takes a connection from the pool
+        :param minconn: connections opened at start
+        :param maxconn: maximal number of connections, e.g. number of watcher threads using storage
+        """
         try:
-            self.conn = psycopg2.connect(
-                f"dbname='{dbname}' user='{user}' host='{host}' port='{port}' password='{pwd}'")
-        except:
-            raise psycopg2.Error('Connection error')
-
-    def read_hand(self, date):
-        if self.conn:
-            with self.conn.cursor() as cur:
-                cur.execute("SELECT hh_id, "
-                            "date_played, "
-                            "room_id, "
-                            "gamenumber, "
-                            "hh FROM handhistory "
-                            f"WHERE date_played > '{date}'")
+            self.pool = ThreadedConnectionPool(minconn, maxconn, dbname=dbname, user=user, host=host, port=port,
+                                               password=pwd)
+        except psycopg2.Error as e:
+            raise psycopg2.Error(f'Connection error: {e}')
+
+    @contextmanager
+    def connection(self):
+        # connection from the pool, transaction is committed or rolled back at the end of block
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            # broken connections are not reused
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    def close(self):
+        self.pool.closeall()
+
+    def read_hand(self, date, columns=('hh', ), itersize=ITERSIZE, page_size=None):
+        """
+        streams hands played after date ordered by (date_played, hh_id) with a named server side cursor,
+        memory usage doesn't depend on the number of hands
+        :param date: datetime or string
+        :param columns: columns of handhistory from HAND_COLUMNS
+        :param itersize: rows fetched from server at once
+        :param page_size: rows per query with keyset pagination on (date_played, hh_id),
+            one query for all hands if None, every page is read in its own transaction
+        :return: generator of hand histories if columns is ('hh', ), tuples of columns otherwise
+        """
+        unknown = set(columns) - set(self.HAND_COLUMNS)
+        if unknown:
+            raise ValueError(f'Unknown columns: {", ".join(sorted(unknown))}')
+
+        # key columns are read after projected columns to continue the next page from the last row
+        fields = sql.SQL(', ').join(sql.Identifier(x) for x in list(columns) + ['date_played', 'hh_id'])
+        first = sql.SQL('SELECT {} FROM handhistory WHERE date_played > %s ').format(fields)
+        next_page = sql.SQL('SELECT {} FROM handhistory WHERE (date_played, hh_id) > (%s, %s) ').format(fields)
+        order = sql.SQL('ORDER BY date_played, hh_id') + (sql.SQL(' LIMIT %s') if page_size else sql.SQL(''))
+        limit = (page_size, ) if page_size else ()
+        hh_only = tuple(columns) == ('hh', )
+
+        key = None
+        while True:
+            rows = 0
+            with self.connection() as conn, conn.cursor(name=f'read_hand_{uuid.uuid4().hex}') as cur:
+                cur.itersize = itersize
+                if key is None:
+                    cur.execute(first + order, (date, ) + limit)
+                else:
+                    cur.execute(next_page + order, tuple(key) + limit)
                 for record in cur:
-                    yield record[4]
+                    rows += 1
+                    key = record[-2:]
+                    yield record[0] if hh_only else record[:-2]
+            if not page_size or rows < page_size:
+                break
+
+    def create_tables(self):
+        # tables of write_results
+        with self.connection() as conn, conn.cursor() as cur:
+            for table, columns in RESULT_TABLES.items():
+                cur.execute(sql.SQL('CREATE TABLE IF NOT EXISTS {} ({}, PRIMARY KEY (hid))').format(
+                    sql.Identifier(table),
+                    sql.SQL(', ').join(sql.SQL('{} {}').format(sql.Identifier(name), sql.SQL(type_))
+                                       for name, type_ in columns)))
+
+    @staticmethod
+    def _copy_upsert(cur, table, rows):
+        # rows are copied into temporary table and merged into table, existing hands are updated
+        columns = [name for name, _ in RESULT_TABLES[table]]
+        # the last row of a hand wins, the same hand can't be updated twice by one statement
+        rows = list({row[0]: row for row in rows}.values())
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+
+        tmp = sql.Identifier(f'tmp_{table}')
+        fields = sql.SQL(', ').join(sql.Identifier(x) for x in columns)
+        cur.execute(sql.SQL('CREATE TEMP TABLE {} (LIKE {}) ON COMMIT DROP').format(tmp, sql.Identifier(table)))
+        cur.copy_expert(sql.SQL('COPY {} ({}) FROM STDIN WITH (FORMAT csv)').format(tmp, fields).as_string(cur),
+                        buf)
+        cur.execute(sql.SQL('INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT (hid) DO UPDATE SET {}').format(
+            sql.Identifier(table), fields, fields, tmp,
+            sql.SQL(', ').join(sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(x)) for x in columns[1:])))
+
+    def write_results(self, hands, results):
+        """
+        writes batch of hands and results in one transaction with COPY, hands written before are replaced
+        :param hands: list of hand_row tuples
+        :param results: list of result_row tuples
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            if hands:
+                self._copy_upsert(cur, 'hrc_hands', hands)
+            if results:
+                self._copy_upsert(cur, 'hrc_results', results)
+
+    def install_trigger(self):
+        # trigger notifying NOTIFY_CHANNEL about new hands, requires rights to create triggers on handhistory
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(NOTIFY_TRIGGER)
+
+    def follow_hands(self, last_id=None, listen=True, poll_interval=POLL_INTERVAL, position=None,
+                     recheck_ids=RECHECK_IDS):
+        """
+        yields hands as they are inserted into handhistory, never returns
+        hands are read by hh_id greater than the last read one, ids of the last recheck_ids range are read again
+        because importers may commit lower hh_id after higher one, ids from notifications of install_trigger
+        below this range are read directly. Without trigger or if LISTEN fails table is checked every poll_interval
+        seconds
+        :param last_id: hh_id to read hands after, hands inserted after start if None
+        :param listen: wait for notifications, polling only if False
+        :param poll_interval: seconds between checks if there are no notifications
+        :param position: FollowPosition updated while reading, pass it again to continue after connection error
+            without missed or repeated hands, last_id is ignored if given
+        :param recheck_ids: size of hh_id range below the last read id checked for late commits
+        :return: generator of tuples (hh_id, hand history)
+        """
+        conn = self.pool.getconn()
+        try:
+            # notifications are delivered outside of transactions only
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                if position is None:
+                    position = FollowPosition(last_id)
+                if position.last_id is None:
+                    cur.execute('SELECT COALESCE(MAX(hh_id), 0) FROM handhistory')
+                    position.last_id = cur.fetchone()[0]
+                if position.seen is None:
+                    # hands of the recheck range existing at start are treated as read
+                    cur.execute('SELECT hh_id FROM handhistory WHERE hh_id > %s AND hh_id <= %s',
+                                (position.last_id - recheck_ids, position.last_id))
+                    position.seen = {x for x, in cur}
+                last_id, seen = position.last_id, position.seen
+                if listen:
+                    try:
+                        cur.execute(sql.SQL('LISTEN {}').format(sql.Identifier(NOTIFY_CHANNEL)))
+                    except psycopg2.Error as e:
+                        logger.error(f'LISTEN error, polling is used: {e}')
+                        listen = False
+
+                notified = set()
+                while True:
+                    low = last_id - recheck_ids
+                    # notified hands committed too late for the recheck range
+                    late = sorted(x for x in notified if x <= low and x not in seen)
+                    notified.clear()
+                    # ids below recheck range are not needed anymore
+                    seen.difference_update([x for x in seen if x <= low])
+                    if late:
+                        cur.execute('SELECT hh_id, hh FROM handhistory WHERE hh_id = ANY(%s) ORDER BY hh_id', (late, ))
+                        for hh_id, hh in cur.fetchall():
+                            yield hh_id, hh
+
+                    rows = self.ITERSIZE
+                    while rows == self.ITERSIZE:
+                        cur.execute('SELECT hh_id, hh FROM handhistory WHERE hh_id > %s AND hh_id <> ALL(%s) '
+                                    'ORDER BY hh_id LIMIT %s',
+                                    (low, sorted(x for x in seen if x > low), self.ITERSIZE))
+                        records = cur.fetchall()
+                        rows = len(records)
+                        for hh_id, hh in records:
+                            seen.add(hh_id)
+                            last_id = position.last_id = max(last_id, hh_id)
+                            yield hh_id, hh
+
+                    if listen:
+                        # woken up by notification or after poll_interval
+                        if select.select([conn], [], [], poll_interval)[0]:
+                            conn.poll()
+                            for notify in conn.notifies:
+                                try:
+                                    notified.add(int(notify.payload))
+                                except ValueError:
+                                    pass
+                            conn.notifies.clear()
+                    else:
+                        time.sleep(poll_interval)
+        finally:
+            try:
+                if not conn.closed:
+                    with conn.cursor() as cur:
+                        cur.execute('UNLISTEN *')
+                    conn.autocommit = False
+            except psycopg2.Error:
+                pass
+            self.pool.putconn(conn, close=bool(conn.closed))
 
     def read_summary(self, tid):
-        if self.conn:
-            with self.conn.cursor() as cur:
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT tournament_id, summary "
+                        "FROM tournament_summaries "
+                        "WHERE tournament_id = %s", (int(tid), ))
+            if cur.rowcount > 0:
+                return cur.fetchone()[1]
+            else:
+                return None
+
+    def read_summaries(self, tids, batch_size=SUMMARY_BATCH):
+        """
+        reads summaries of many tournaments with one query per batch
+        :param tids: iterable of tournament ids
+        :param batch_size: tournament ids per query
+        :return: generator of tuples (tid, TournamentSummary), tournaments without summary are skipped
+        """
+        tids = [int(x) for x in tids]
+        for start in range(0, len(tids), batch_size):
+            with self.connection() as conn, conn.cursor() as cur:
                 cur.execute("SELECT tournament_id, summary "
                             "FROM tournament_summaries "
-                            f"WHERE tournament_id = {tid}")
-                if cur.rowcount > 0:
-                    return cur.fetchone()[1]
-                else:
-                    return None
+                            "WHERE tournament_id = ANY(%s)", (tids[start:start + batch_size], ))
+                for tid, summary in cur:
+                    yield tid, TournamentSummary(summary)
 
 
 class HandStorage(object):
@@ -56,23 +457,29 @@ class HandStorage(object):
     def read_hand(self):
 
         fi = glob.glob(f'{self.path}/**/*.txt', recursive=True)
-  
+
         for file in fi:
+            try:
+                for _, hand in split_hands(file):
+                    yield hand
+            except OSError:
+                continue
 
-            with open(file, encoding='utf-8') as f:
-
-                try:
-                    
-                    s = f.read()
-                    s = s.split('\n\n')
-                    for ss in s:
-                        if ss == '\n\n' or ss==None or ss == '':
-                            continue
-                        yield ss
-                        
-                except:
-                    continue
-        
-        
-                
-    
+    def read_records(self, cache=None):
+        """
+        parsed hands of all files
+        :param cache: HandCache, only not cached parts of files are parsed if given
+        :return: generator of HandRecord
+        """
+        # bulk_import imports this module
+        from bulk_import import parse_file
+
+        for file in glob.glob(f'{self.path}/**/*.txt', recursive=True):
+            try:
+                if cache is not None:
+                    yield from cache.read(file, parse_file)
+                else:
+                    for _, record in parse_file(file)[0]:
+                        yield record
+            except OSError:
+                continue
@@ -7,6 +7,7 @@ Created on Tue Aug  9 14:02:58 2016
 import re
 import numpy as np
 import itertools
+import icm
 from datetime import datetime
 
 ACTIONS = {
@@ -17,6 +18,69 @@ ACTIONS = {
     'checks': 'x'
 }
 
+# sections of hand history in order, street marker -> section name
+STREETS = [
+    ('*** HOLE CARDS ***', 'preflop'),
+    ('*** FLOP ***', 'flop'),
+    ('*** TURN ***', 'turn'),
+    ('*** RIVER ***', 'river'),
+    ('*** SHOW DOWN ***', 'showdown'),
+    ('*** SUMMARY ***', 'summary'),
+]
+SECTIONS = ['caption'] + [x[1] for x in STREETS]
+BETTING_STREETS = ('preflop', 'flop', 'turn', 'river')
+
+
+def _line_event(line, street):
+    #   type of line event determined by cheap substring checks
+    if street == 'caption':
+        if line.startswith('Seat '):
+            return 'seat'
+        if ': posts ' in line:
+            return 'post'
+        if 'Hand #' in line or 'Tournament #' in line:
+            return 'header'
+    elif street in BETTING_STREETS:
+        if 'Dealt to ' in line:
+            return 'dealt'
+        if 'Uncalled' in line:
+            return 'uncalled'
+        if ' collected ' in line:
+            return 'collect'
+        if ':' in line:
+            return 'action'
+    elif street == 'showdown':
+        if ' collected ' in line:
+            return 'collect'
+        if ' bounty' in line:
+            return 'bounty'
+        if 'finished' in line or 'wins' in line:
+            return 'finish'
+    elif street == 'summary':
+        if 'Total pot' in line:
+            return 'pot'
+        if ' showed ' in line:
+            return 'shown'
+    return 'other'
+
+
+def tokenize(hand_history):
+    """
+    splits hand history into typed line events in one pass
+    :param hand_history: text of one hand
+    :return: generator of tuples (event, section, line)
+    """
+    street = 'caption'
+    for line in hand_history.split('\n'):
+        if line.startswith('*** '):
+            for marker, name in STREETS:
+                if line.startswith(marker):
+                    street = name
+                    break
+            yield 'board', street, line
+        else:
+            yield _line_event(line, street), street, line
+
 
 class cached_property(object):
     def __init__(self, func):
@@ -24,6 +88,13 @@ class cached_property(object):
 
     def __get__(self, instance, cls=None):
         result = instance.__dict__[self.func.__name__] = self.func(instance)
+        pending = instance.__dict__.get('_pending')
+        if pending is not None:
+            pending.discard(self.func.__name__)
+            if not pending:
+                # all properties are computed, matches of single pass are not needed anymore,
+                # methods like actions_sequence use regular expressions after that
+                instance._matches = instance._pending = None
         return result
 
 class Actions(enumerate):
@@ -33,37 +104,39 @@ class Actions(enumerate):
 class HandHistoryParser:
     PRIZE = []
     POSITIONS = ['BB', 'SB', 'BU', 'CO', 'MP2', 'MP1', 'UTG3', 'UTG2', 'UTG1']
-    UNCALLED_REGEX = "Uncalled.*\((?P<bet>\d+)\).*to (?P<player>.*)"
+    UNCALLED_REGEX = re.compile("Uncalled.*\((?P<bet>\d+)\).*to (?P<player>.*)")
     UNCALLED_DICT = {'player': 'bet'}
-    CHIPWON_REGEX = "(?P<player>.*) collected (?P<chipwon>\d+)"
+    CHIPWON_REGEX = re.compile("(?P<player>.*) collected (?P<chipwon>\d+)")
     CHIPWON_DICT = {'player': 'chipwon'}
-    FINISHES_REGEX = "(?P<player>.*?) (?:finished.*in (?P<place>\d+)(?:nd|rd|th)|wins the tournament)"
-    PRIZE_WON_REGEX = "(?P<player>.*) (?:wins|finished).*and (?:received|receives) \$(?P<prize>\d+\.\d+)(?:.|\s)"
-    BLINDS_ANTE_REGEX = "(?P<player>.*): posts .*?(?P<bet>\d+)"
-    BOUNTY_WON_REGEX = "(?P<player>.*) wins the \$(?P<bounty>.*) bounty"
-    RIVER_REGEX = "RIVER.*\[(?:.*)\] \[(?P<river>.{2})\]"
-    TURN_REGEX = "TURN.*\[(?:.*)\] \[(?P<turn>.{2})\]"
-    ANTE_REGEX = "(?P<player>.*): posts the ante (?P<bet>\d+)"
-    BLINDS_REGEX = "(?P<player>.*): posts (?:small|big) blind (?P<bet>\d+)"
+    FINISHES_REGEX = re.compile("(?P<player>.*?) (?:finished.*in (?P<place>\d+)(?:nd|rd|th)|wins the tournament)")
+    PRIZE_WON_REGEX = re.compile("(?P<player>.*) (?:wins|finished).*and (?:received|receives) \$(?P<prize>\d+\.\d+)(?:.|\s)")
+    BLINDS_ANTE_REGEX = re.compile("(?P<player>.*): posts .*?(?P<bet>\d+)")
+    BOUNTY_WON_REGEX = re.compile("(?P<player>.*) wins the \$(?P<bounty>.*) bounty")
+    RIVER_REGEX = re.compile("RIVER.*\[(?:.*)\] \[(?P<river>.{2})\]")
+    TURN_REGEX = re.compile("TURN.*\[(?:.*)\] \[(?P<turn>.{2})\]")
+    ANTE_REGEX = re.compile("(?P<player>.*): posts the ante (?P<bet>\d+)")
+    BLINDS_REGEX = re.compile("(?P<player>.*): posts (?:small|big) blind (?P<bet>\d+)")
     BLINDS_ANTE_DICT = {'player': 'bet'}
-    SB_PLAYER_REGEX = "(?P<player>.*):\sposts small"
-    BB_PLAYER_REGEX = "(?P<player>.*):\sposts big"
-    P_ACTIONS_REGEX = "(?P<player>.*):\s(?P<action>calls|raises|folds|checks)"
-    ACTIONS_REGEX = "(?P<player>.*):\s(?P<action>calls|raises|bets|folds|checks)"
+    SB_PLAYER_REGEX = re.compile("(?P<player>.*):\sposts small")
+    BB_PLAYER_REGEX = re.compile("(?P<player>.*):\sposts big")
+    P_ACTIONS_REGEX = re.compile("(?P<player>.*):\s(?P<action>calls|raises|folds|checks)")
+    ACTIONS_REGEX = re.compile("(?P<player>.*):\s(?P<action>calls|raises|bets|folds|checks)")
     ACTIONS_DICT = {'player': 'action'}
-    ACTIONS_AMOUNTS_REGEX = "(?P<player>.*?): (?:calls|raises.*to|bets|checks) (?P<amount>\d+)?"
+    ACTIONS_AMOUNTS_REGEX = re.compile("(?P<player>.*?): (?:calls|raises.*to|bets|checks) (?P<amount>\d+)?")
     ACTIONS_AMOUNTS_DICT = {'player': 'amount'}
-    AI_PLAYERS_REGEX = "(?P<player>.*):.* all-in"
-    KNOWN_CARDS_REGEX = "Seat \d: (?P<player>.*?)\s?(?:\(button\) showed|\(small blind\) showed|\(button\) \(small blind\) showed|\(big blind\) showed| showed)\s\[(?P<knowncards>.*)\]"
+    AI_PLAYERS_REGEX = re.compile("(?P<player>.*):.* all-in")
+    KNOWN_CARDS_REGEX = re.compile("Seat \d: (?P<player>.*?)\s?(?:\(button\) showed|\(small blind\) showed|\(button\) \(small blind\) showed|\(big blind\) showed| showed)\s\[(?P<knowncards>.*)\]")
     KNOWN_CARDS_DICT = {'player': 'knowncards'}
-    FLOP_REGEX = "FLOP.*\[(?P<flop>.*)\]"
-    POT_LIST_REGEX = "(Total|Main|Side) (pot|pot-1|pot-2|pot-3|pot-4|pot-5)\s(?P<pot>\d*)"
-    DATETIME_REGEX = "(?P<datetime>\d{4}/\d{2}/\d{2}\s\d{1,2}:\d{1,2}:\d{1,2})\sET"
-    TID_REGEX = "Tournament #(?P<tid>\d+)"
-    HID_REGEX = "Hand #(?P<hid>\d+)"
-    HERO_REGEX = r"Dealt to (?P<hero>.*)\s\["
-    HERO_CARDS_REGEX = r"Dealt to .*\s\[(?P<cards>.*)]"
-    BI_BOUNTY_RAKE_REGEX = "Tournament\s#\d+,\s\$(?P<bi>\d+?\.\d+)(?:\+\$)?(?P<bounty>\d+?\.\d+)?\+\$(?P<rake>\d+?\.\d+)"
+    FLOP_REGEX = re.compile("FLOP.*\[(?P<flop>.*)\]")
+    POT_LIST_REGEX = re.compile("(Total|Main|Side) (pot|pot-1|pot-2|pot-3|pot-4|pot-5)\s(?P<pot>\d*)")
+    DATETIME_REGEX = re.compile("(?P<datetime>\d{4}/\d{2}/\d{2}\s\d{1,2}:\d{1,2}:\d{1,2})\sET")
+    TID_REGEX = re.compile("Tournament #(?P<tid>\d+)")
+    HID_REGEX = re.compile("Hand #(?P<hid>\d+)")
+    HERO_REGEX = re.compile(r"Dealt to (?P<hero>.*)\s\[")
+    HERO_CARDS_REGEX = re.compile(r"Dealt to .*\s\[(?P<cards>.*)]")
+    SEAT_REGEX = re.compile("Seat\s?[0-9]:\s(.*)\s\(\s?\$?(\d*,?\d*)\s(?:in\schips)?")
+    LEVEL_REGEX = re.compile("Level\s.+\s\((?P<sb>\d+)/(?P<bb>\d+)\)")
+    BI_BOUNTY_RAKE_REGEX = re.compile("Tournament\s#\d+,\s\$(?P<bi>\d+?\.\d+)(?:\+\$)?(?P<bounty>\d+?\.\d+)?\+\$(?P<rake>\d+?\.\d+)")
 
     def _process_regexp(
             self,
@@ -86,8 +159,26 @@ class HandHistoryParser:
         :return:
         """
         # extracts named groups from result of re and converts it into dict or list
-        it = re.finditer(pattern, text)
+        return self._process_matches(
+            re.finditer(pattern, text),
+            *args,
+            type_func=type_func,
+            reslist=reslist,
+            default_value=default_value,
+            **kwargs)
 
+    def _process_matches(
+            self,
+            it,
+            *args,
+            type_func=lambda x: x,
+            reslist=False,
+            default_value=0,
+            **kwargs):
+        """
+        same as _process_regexp for already found matches
+        :param it: iterable with match objects
+        """
         res = []
         for x in args:
             for i in it:
@@ -128,8 +219,8 @@ class HandHistoryParser:
 
 class TournamentSummary(HandHistoryParser):
 
-    FINISHES_REGEX = "You finished in (?P<place>\d+)(?:nd|rd|th|st)"
-    PRIZE_WON_REGEX = "(?:\d+):\s(?P<player>.*)\s\(.*\),\s\$(?P<prize>\d+\.\d+)"
+    FINISHES_REGEX = re.compile("You finished in (?P<place>\d+)(?:nd|rd|th|st)")
+    PRIZE_WON_REGEX = re.compile("(?:\d+):\s(?P<player>.*)\s\(.*\),\s\$(?P<prize>\d+\.\d+)")
 
     def __init__(self, ts_text):
         self.ts_text = ts_text
@@ -157,36 +248,47 @@ class TournamentSummary(HandHistoryParser):
 
 
 class HHParser(HandHistoryParser):
+    # patterns matched against every type of line event in single pass mode
+    EVENT_PATTERNS = {
+        'header': ['TID_REGEX', 'HID_REGEX', 'DATETIME_REGEX', 'BI_BOUNTY_RAKE_REGEX', 'LEVEL_REGEX'],
+        'seat': ['SEAT_REGEX'],
+        'post': ['BLINDS_ANTE_REGEX', 'ANTE_REGEX', 'BLINDS_REGEX', 'SB_PLAYER_REGEX', 'BB_PLAYER_REGEX'],
+        'dealt': ['HERO_REGEX', 'HERO_CARDS_REGEX'],
+        'action': ['ACTIONS_REGEX', 'ACTIONS_AMOUNTS_REGEX', 'AI_PLAYERS_REGEX'],
+        'uncalled': ['UNCALLED_REGEX'],
+        'collect': ['CHIPWON_REGEX'],
+        'board': ['FLOP_REGEX', 'TURN_REGEX', 'RIVER_REGEX'],
+        'finish': ['FINISHES_REGEX', 'PRIZE_WON_REGEX'],
+        'bounty': ['BOUNTY_WON_REGEX'],
+        'pot': ['POT_LIST_REGEX'],
+        'shown': ['KNOWN_CARDS_REGEX'],
+    }
+    # substrings without which the pattern can't match the line, lines without them are not matched
+    PATTERN_LITERALS = {
+        'SB_PLAYER_REGEX': 'posts small',
+        'BB_PLAYER_REGEX': 'posts big',
+        'BLINDS_REGEX': ' blind ',
+        'ANTE_REGEX': 'posts the ante',
+        'AI_PLAYERS_REGEX': ' all-in',
+        'PRIZE_WON_REGEX': '$',
+    }
 
     def __str__(self):
         return f"Hand: #{self.hid} Tournament: #{self.tid} \${self.bi} [{self.datetime}]"
 
-    def __init__(self, hh):
+    def __init__(self, hh, prize=None, single_pass=False):
+        #       prize - list of prizes 1st place first, used for icm calculations
+        #       single_pass - walk hand history once and match every line only with patterns of its event type
         #       todo проверка является ли строка hand history
         self.hand_history = hh
 
-        #       split the original hand histoty into logical sections preflop flop ...
-        hist_text = self.hand_history
-
-        self.summary_str = hist_text[hist_text.find("*** SUMMARY ***"):]
-        hist_text = hist_text[:hist_text.find("*** SUMMARY ***")]
+        # sections are not needed in single pass mode, they are split on first access
+        if not single_pass:
+            self._split_sections()
 
-        self.showdown_str = hist_text[hist_text.find("*** SHOW DOWN ***"):]
-        hist_text = hist_text[:hist_text.find("*** SHOW DOWN ***")]
-
-        self.river_str = hist_text[hist_text.find("*** RIVER ***"):]
-        hist_text = hist_text[:hist_text.find("*** RIVER ***")]
-
-        self.turn_str = hist_text[hist_text.find("*** TURN ***"):]
-        hist_text = hist_text[:hist_text.find("*** TURN ***")]
-
-        self.flop_str = hist_text[hist_text.find("*** FLOP ***"):]
-        hist_text = hist_text[:hist_text.find("*** FLOP ***")]
-
-        self.preflop_str = hist_text[hist_text.find("*** HOLE CARDS ***"):]
-        hist_text = hist_text[:hist_text.find("*** HOLE CARDS ***")]
-
-        self.caption_str = hist_text
+        self._matches = self._tokenize() if single_pass else None
+        # cached properties not computed yet, matches are dropped when all of them are computed
+        self._pending = set(self._cached_properties()) if single_pass else None
 
         self.sb = 0
         self.bb = 0
@@ -202,16 +304,14 @@ class HHParser(HandHistoryParser):
         #        t = re.compile(regex_ps)
         #        if t.match(self.hand_history):
         #            print("poker stars hand detected")
-        regex = "Seat\s?[0-9]:\s(.*)\s\(\s?\$?(\d*,?\d*)\s(?:in\schips)?"
-        sbplayer_regex = "(.*)?:\sposts small"
-        bbplayer_regex = "(.*)?:\sposts big"
-        blinds_regex = "Level\s.+\s\((?P<sb>\d+)/(?P<bb>\d+)\)"
-
         #        t = re.search(regex)
 
-        self.PRIZE = np.array([0.50, 0.50])
+        if prize is None:
+            self.PRIZE = np.array([0.50, 0.50])
+        else:
+            self.PRIZE = np.asarray(prize, dtype=float)
 
-        tupples = re.findall(regex, self.hand_history)
+        tupples = [x.groups() for x in self._find(self.SEAT_REGEX)]
 
         self.players = [x[0] for x in tupples]
         self._stacks_list = [float(x[1].replace(",", "")) for x in tupples]
@@ -229,19 +329,19 @@ class HHParser(HandHistoryParser):
         finally:
             pass
 
-        res = re.search(bbplayer_regex, self.hand_history)
+        res = next(self._find(self.BB_PLAYER_REGEX), None)
         if res:
-            self.big_blind = self.players.index(res.group(1))
+            self.big_blind = self.players.index(res.group('player'))
             self.preflop_order = self.players[self.big_blind + 1:] + self.players[:self.big_blind + 1]
         else:
-            res = re.search(sbplayer_regex, self.hand_history)
+            res = next(self._find(self.SB_PLAYER_REGEX), None)
             if res:
-                self.small_blind = self.players.index(res.group(1))
+                self.small_blind = self.players.index(res.group('player'))
                 self.preflop_order = self.players[self.small_blind + 1:] + self.players[:self.small_blind + 1]
 
         # в префлоп ордер теперь содержится порядок действия игроков как они сидят префлоп от утг до бб
 
-        res = re.search(blinds_regex, self.hand_history)
+        res = next(self._find(self.LEVEL_REGEX), None)
         if res:
             self.sb = int(res.groupdict().get('sb', '10'))
             self.bb = int(res.groupdict().get('bb', '20'))
@@ -250,133 +350,121 @@ class HHParser(HandHistoryParser):
 
 
 
+    def __getattr__(self, name):
+        # section strings like preflop_str are split on first access
+        if name.endswith('_str') and name[:-4] in SECTIONS and 'hand_history' in self.__dict__:
+            self._split_sections()
+            return self.__dict__[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def _split_sections(self):
+        #       split the original hand histoty into logical sections preflop flop ...
+        hist_text = self.hand_history
+
+        self.summary_str = hist_text[hist_text.find("*** SUMMARY ***"):]
+        hist_text = hist_text[:hist_text.find("*** SUMMARY ***")]
+
+        self.showdown_str = hist_text[hist_text.find("*** SHOW DOWN ***"):]
+        hist_text = hist_text[:hist_text.find("*** SHOW DOWN ***")]
+
+        self.river_str = hist_text[hist_text.find("*** RIVER ***"):]
+        hist_text = hist_text[:hist_text.find("*** RIVER ***")]
+
+        self.turn_str = hist_text[hist_text.find("*** TURN ***"):]
+        hist_text = hist_text[:hist_text.find("*** TURN ***")]
+
+        self.flop_str = hist_text[hist_text.find("*** FLOP ***"):]
+        hist_text = hist_text[:hist_text.find("*** FLOP ***")]
+
+        self.preflop_str = hist_text[hist_text.find("*** HOLE CARDS ***"):]
+        hist_text = hist_text[:hist_text.find("*** HOLE CARDS ***")]
+
+        self.caption_str = hist_text
+
+    @classmethod
+    def _cached_properties(cls):
+        # names of all cached properties of the class
+        res = cls.__dict__.get('_cached_names')
+        if res is None:
+            res = frozenset(k for klass in cls.__mro__ for k, v in vars(klass).items()
+                            if isinstance(v, cached_property))
+            cls._cached_names = res
+        return res
+
+    @classmethod
+    def _event_patterns(cls):
+        # dict {event: [(pattern, required substring or None)]} built once for the class
+        res = cls.__dict__.get('_event_table')
+        if res is None:
+            res = {k: [(getattr(cls, x), cls.PATTERN_LITERALS.get(x)) for x in v]
+                   for k, v in cls.EVENT_PATTERNS.items()}
+            cls._event_table = res
+        return res
+
+    def _tokenize(self):
+        #   returns dict {(pattern, section): [matches]} for the whole hand collected in one pass
+        event_patterns = self._event_patterns()
+        res = {}
+        for event, street, line in tokenize(self.hand_history):
+            for pattern, literal in event_patterns.get(event, ()):
+                if literal is not None and literal not in line:
+                    continue
+                for m in pattern.finditer(line):
+                    key = (pattern, street)
+                    if key in res:
+                        res[key].append(m)
+                    else:
+                        res[key] = [m]
+        return res
+
+    def _find(self, pattern, *sections):
+        """
+        finds pattern in sections of hand history
+        :param pattern: compiled regex
+        :param sections: names of sections from SECTIONS, whole hand if empty
+        :return: iterator with match objects
+        """
+        if self._matches is None:
+            if sections:
+                text = ''.join(getattr(self, f'{x}_str') for x in sections)
+            else:
+                text = self.hand_history
+            return re.finditer(pattern, text)
+
+        if not sections:
+            sections = SECTIONS
+        return itertools.chain.from_iterable(self._matches.get((pattern, x), ()) for x in sections)
+
     def p1p(self, ind, place):
         #       вероятность place го места для игрока ind
 
-        #       s - список стэков игроков
         #       ind - индекс стэка для которого считаестя вероятность
-        #       place - место целое число, должно быть не больше чем длина списка s
+        #       place - место целое число, должно быть не больше чем число игроков
 
         sz = self.players_number()
 
-        #
         if place > sz:
             return 0
         if ind + 1 > sz:
             return 0
-        #       если стэк 0 сразу вернем 0
 
-        if self.getStack(ind) == 0:
-            if sz - 1 >= np.size(self.PRIZE):
-                return 0
-            else:
-                return self.PRIZE[sz - 1]
-
-        p = []
-
-        # получаем все возможные варианты распределения мест
-        #           индекс в списке соответствует месту игрока
-        for i in itertools.permutations(range(sz), sz):
-            #               выбираем только те распределения где игрок ind на месте place
-            if i[place - 1] == ind:
-                #                    из списка издексов с распределением мест,
-                #                    формируем список со значениями стеков
-                si = []
-                for j in i:
-                    si.append(self.getStack(j))
-                #                    with Profiler() as pr:
-                pi = 1
-                for j in range(sz):
-                    sum_ = sum(si[j:])
-                    if sum_ != 0:
-                        pi = pi * si[j] / sum_
-
-                p.append(pi)
-
-        result = sum(p)
-        return result
+        return icm.place_probabilities(self._stacks_list, place)[place - 1, ind]
 
     def icm_eq(self, stacks=None):
-        if stacks is not None:
-            SZ = np.size(stacks)
-        else:
-            SZ = np.size(self._stacks_list)
-            stacks = np.copy(self._stacks_list)
-
-        #        place_probe = np.zeros(SZ, 3)
-
-        #       end p1p()
+        if stacks is None:
+            stacks = self._stacks_list
 
-        #       perm = itertools.permutations(range(SZ), SZ)
-
-        ind1 = range(0, SZ)
-
-        min_place = min(SZ, np.size(self.PRIZE))
-        p1 = np.zeros(shape=(min_place, SZ))
-        ind2 = range(0, min_place)
-        # p1 строка - занятое место, столбец - номер игрока
-        for i in ind1:
-            for j in ind2:
-                p1[j, i] = self.p1p(i, j + 1)
-                # в функции место нумеруются с 1 до 3, в матрице с 0 до 2  
-
-        #
-        eq = np.dot(self.PRIZE[:min_place], p1)
-        return eq
+        return icm.icm_equity(stacks, self.PRIZE)[0]
 
     def icm_eq_dict(self, stacks=None):
-        if stacks is not None:
-            SZ = np.size(stacks)
-        else:
-            SZ = np.size(self._stacks_list)
-            stacks = np.copy(self._stacks_list)
-        ind1 = range(0, SZ)
-        min_place = min(SZ, np.size(self.PRIZE))
-        p1 = np.zeros(shape=(min_place, SZ))
-        ind2 = range(0, min_place)
-        # p1 строка - занятое место, столбец - номер игрока
-        for i in ind1:
-            for j in ind2:
-                p1[j, i] = self.p1p(i, j + 1)
-                # в функции место нумеруются с 1 до 3, в матрице с 0 до 2
-        #
-        eq = np.dot(self.PRIZE[:min_place], p1)
-        return {self.players[i]: round(eq[i], 4) for i in range(SZ)}
+        if stacks is None:
+            stacks = self._stacks_list
 
-    def tie_factor(self):
-        eq = self.icm_eq()
-        st = np.array(self._stacks_list)
-        sz = np.size(st)
-        result = np.zeros((sz, sz))
-        for i in range(sz):
-            for j in range(sz):
-                if i == j:
-                    continue
+        eq = icm.icm_equity(stacks, self.PRIZE)[0]
+        return {self.players[i]: round(eq[i], 4) for i in range(np.size(stacks))}
 
-                stacks_win = np.copy(st)
-                stacks_lose = np.copy(st)
-                if st[i] > st[j]:
-                    stacks_win[i] = st[i] + st[j]
-                    stacks_win[j] = 0
-                    stacks_lose[i] = st[i] - st[j]
-                    stacks_lose[j] = st[j] * 2
-                else:
-                    stacks_win[i] = st[i] * 2
-                    stacks_win[j] = st[j] - st[i]
-                    stacks_lose[i] = 0
-                    stacks_lose[j] = st[i] + st[j]
-                eq_win = self.icm_eq(stacks_win)
-                eq_lose = self.icm_eq(stacks_lose)
-                #                print(stacks_win)
-                #                print(stacks_lose)
-                #                print(eq_win)
-                #                print(eq_lose)
-                #
-                #                print(i, j)
-                bubble_factor = (eq[i] - eq_lose[i]) / (eq_win[i] - eq[i])
-                result[i, j] = bubble_factor / (1 + bubble_factor)
-        #                if i > 1 and j > 1: return result
-        return result
+    def tie_factor(self):
+        return icm.tie_factors(self._stacks_list, self.PRIZE)
 
     def tournamentPosition(self, player):
 
@@ -490,9 +578,8 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def bi(self):
-        res = self._process_regexp(
-            self.BI_BOUNTY_RAKE_REGEX,
-            self.caption_str,
+        res = self._process_matches(
+            self._find(self.BI_BOUNTY_RAKE_REGEX, 'caption'),
             'bi',
             type_func=lambda x: float(x),
         )
@@ -502,9 +589,8 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def bounty(self):
-        res = self._process_regexp(
-            self.BI_BOUNTY_RAKE_REGEX,
-            self.caption_str,
+        res = self._process_matches(
+            self._find(self.BI_BOUNTY_RAKE_REGEX, 'caption'),
             'bounty',
             type_func=lambda x: float(x),
         )
@@ -512,9 +598,8 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def rake(self):
-        return self._process_regexp(
-            self.BI_BOUNTY_RAKE_REGEX,
-            self.caption_str,
+        return self._process_matches(
+            self._find(self.BI_BOUNTY_RAKE_REGEX, 'caption'),
             'rake',
             type_func=lambda x: float(x),
         )
@@ -531,21 +616,19 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def tid(self):
-        return self._process_regexp(self.TID_REGEX, self.caption_str, 'tid')
+        return self._process_matches(self._find(self.TID_REGEX, 'caption'), 'tid')
 
     @cached_property
     def hid(self):
-        return self._process_regexp(
-            self.HID_REGEX,
-            self.caption_str,
+        return self._process_matches(
+            self._find(self.HID_REGEX, 'caption'),
             'hid'
         )
 
     @cached_property
     def datetime(self):
-        res = self._process_regexp(
-            self.DATETIME_REGEX,
-            self.caption_str,
+        res = self._process_matches(
+            self._find(self.DATETIME_REGEX, 'caption'),
             'datetime'
         )
         dt_str_format = '%Y/%m/%d %H:%M:%S'
@@ -558,9 +641,8 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def p_actions(self):
-        return self._process_regexp(
-            self.ACTIONS_REGEX,
-            self.preflop_str,
+        return self._process_matches(
+            self._find(self.ACTIONS_REGEX, 'preflop'),
             type_func=lambda x: ACTIONS[x],
             reslist=True,
             **self.ACTIONS_DICT
@@ -568,9 +650,8 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def f_actions(self):
-        return self._process_regexp(
-            self.ACTIONS_REGEX,
-            self.flop_str,
+        return self._process_matches(
+            self._find(self.ACTIONS_REGEX, 'flop'),
             type_func= lambda x: ACTIONS[x],
             reslist=True,
             **self.ACTIONS_DICT
@@ -578,9 +659,8 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def t_actions(self):
-        return self._process_regexp(
-            self.ACTIONS_REGEX,
-            self.turn_str,
+        return self._process_matches(
+            self._find(self.ACTIONS_REGEX, 'turn'),
             type_func= lambda x: ACTIONS[x],
             reslist=True,
             **self.ACTIONS_DICT
@@ -588,8 +668,7 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def r_actions(self):
-        return self._process_regexp(self.ACTIONS_REGEX,
-                                                  self.river_str,
+        return self._process_matches(self._find(self.ACTIONS_REGEX, 'river'),
                                                    type_func= lambda x: ACTIONS[x],
                                                    reslist=True,
                                                    **self.ACTIONS_DICT)
@@ -599,41 +678,36 @@ class HHParser(HandHistoryParser):
         # todo сюда не попадают игроки которые заколили или поставили игрока под аи оставив в своем стэке фишки
 
         #       returns list of players which is all in preflop
-        return self._process_regexp(self.AI_PLAYERS_REGEX,
-                                                     self.preflop_str,
+        return self._process_matches(self._find(self.AI_PLAYERS_REGEX, 'preflop'),
                                                     'player',
                                                       reslist=True)
 
     @cached_property
     def f_ai_players(self):
         #       returns list of players which is all in preflop
-        return self._process_regexp(self.AI_PLAYERS_REGEX,
-                                                     self.flop_str,
+        return self._process_matches(self._find(self.AI_PLAYERS_REGEX, 'flop'),
                                                     'player',
                                                       reslist=True)
 
     @cached_property
     def t_ai_players(self):
         #       returns list of players which is all in preflop
-        return self._process_regexp(self.AI_PLAYERS_REGEX,
-                                                     self.turn_str,
+        return self._process_matches(self._find(self.AI_PLAYERS_REGEX, 'turn'),
                                                     'player',
                                                       reslist=True)
 
     @cached_property
     def r_ai_players(self):
         #       returns list of players which is all in preflop
-        return self._process_regexp(self.AI_PLAYERS_REGEX,
-                                                     self.river_str,
+        return self._process_matches(self._find(self.AI_PLAYERS_REGEX, 'river'),
                                                     'player',
                                                       reslist=True)
 
     @cached_property
     def pot_list(self):
         #       returns list with 1st item is total pot and all af the side pots if presents
-        return self._process_regexp(
-                                                  self.POT_LIST_REGEX,
-                                                  self.summary_str,
+        return self._process_matches(
+                                                  self._find(self.POT_LIST_REGEX, 'summary'),
                                                   'pot',
                                                   reslist=True,
                                                   type_func=lambda x: int(x)
@@ -641,32 +715,28 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def p_actions_amounts(self):
-        return self._process_regexp(self.ACTIONS_AMOUNTS_REGEX,
-                                                  self.preflop_str,
+        return self._process_matches(self._find(self.ACTIONS_AMOUNTS_REGEX, 'preflop'),
                                                    type_func= lambda x: int(x),
                                                    reslist=True,
                                                    **self.ACTIONS_AMOUNTS_DICT)
 
     @cached_property
     def f_actions_amounts(self):
-        return self._process_regexp(self.ACTIONS_AMOUNTS_REGEX,
-                                                  self.flop_str,
+        return self._process_matches(self._find(self.ACTIONS_AMOUNTS_REGEX, 'flop'),
                                                    type_func= lambda x: int(x),
                                                    reslist=True,
                                                    **self.ACTIONS_AMOUNTS_DICT)
 
     @cached_property
     def t_actions_amounts(self):
-        return self._process_regexp(self.ACTIONS_AMOUNTS_REGEX,
-                                                  self.turn_str,
+        return self._process_matches(self._find(self.ACTIONS_AMOUNTS_REGEX, 'turn'),
                                                    type_func= lambda x: int(x),
                                                    reslist=True,
                                                    **self.ACTIONS_AMOUNTS_DICT)
 
     @cached_property
     def r_actions_amounts(self):
-        return self._process_regexp(self.ACTIONS_AMOUNTS_REGEX,
-                                                  self.river_str,
+        return self._process_matches(self._find(self.ACTIONS_AMOUNTS_REGEX, 'river'),
                                                    type_func= lambda x: int(x),
                                                    reslist=True,
                                                    **self.ACTIONS_AMOUNTS_DICT)
@@ -744,53 +814,46 @@ class HHParser(HandHistoryParser):
     @cached_property
     def hero(self):
         #       returns hero name
-        return self._process_regexp(
-                self.HERO_REGEX,
-                self.preflop_str,
+        return self._process_matches(
+                self._find(self.HERO_REGEX, 'preflop'),
                 'hero'
             )
 
     @cached_property
     def hero_cards(self):
-        return self._process_regexp(
-                self.HERO_CARDS_REGEX,
-                self.preflop_str,
+        return self._process_matches(
+                self._find(self.HERO_CARDS_REGEX, 'preflop'),
                 'cards'
             )
 
     @cached_property
     def known_cards(self):
-            return self._process_regexp(self.KNOWN_CARDS_REGEX,
-                                                     self.summary_str,
+            return self._process_matches(self._find(self.KNOWN_CARDS_REGEX, 'summary'),
                                                      # type_func=lambda x: ''.join(x.split()),
                                                      **self.KNOWN_CARDS_DICT,
                                                      )
 
     @cached_property
     def flop(self):
-        return self._process_regexp(self.FLOP_REGEX,
-                                              self.flop_str,
+        return self._process_matches(self._find(self.FLOP_REGEX, 'flop'),
                                               'flop',
                                               # type_func=lambda x: ''.join(x.split()),
                                               )
 
     @cached_property
     def turn(self):
-        return self._process_regexp(self.TURN_REGEX,
-                                              self.turn_str,
+        return self._process_matches(self._find(self.TURN_REGEX, 'turn'),
                                               'turn')
 
     @cached_property
     def river(self):
-        return self._process_regexp(self.RIVER_REGEX,
-                                              self.river_str,
+        return self._process_matches(self._find(self.RIVER_REGEX, 'river'),
                                               'river')
 
     @cached_property
     def bounty_won(self):
         #   bounty won in hand
-        res = self._process_regexp(self.BOUNTY_WON_REGEX,
-                                                   self.showdown_str,
+        res = self._process_matches(self._find(self.BOUNTY_WON_REGEX, 'showdown'),
                                                    type_func=lambda x: float(x),
                                                    **{'player':'bounty'})
         # 1 more bounty for the 1st place
@@ -801,23 +864,20 @@ class HHParser(HandHistoryParser):
 
     @cached_property
     def prize_won(self):
-        return self._process_regexp(self.PRIZE_WON_REGEX,
-                                                  self.showdown_str,
+        return self._process_matches(self._find(self.PRIZE_WON_REGEX, 'showdown'),
                                                   type_func=lambda x: float(x),
                                                   **{'player':'prize'})
 
     @cached_property
     def chip_won(self):
-        return self._process_regexp(self.CHIPWON_REGEX,
-                                                 self.showdown_str + self.preflop_str,
+        return self._process_matches(self._find(self.CHIPWON_REGEX, 'showdown', 'preflop'),
                                                  type_func=lambda x: int(x),
                                                  reslist=True,
                                                  **self.CHIPWON_DICT)
 
     @cached_property
     def finishes(self):
-        res = self._process_regexp(self.FINISHES_REGEX,
-                                                   self.showdown_str,
+        res = self._process_matches(self._find(self.FINISHES_REGEX, 'showdown'),
                                                    type_func=lambda x: int(x),
                                                    **{'player':'place'})
         if res:
@@ -829,7 +889,7 @@ class HHParser(HandHistoryParser):
     @cached_property
     def blinds_antes(self):
         #returns dict {player: bet before preflop}
-        res = re.findall(self.BLINDS_ANTE_REGEX, self.caption_str)
+        res = [x.groups() for x in self._find(self.BLINDS_ANTE_REGEX, 'caption')]
         dic = {}
         if res:
             for x in res:
@@ -843,8 +903,7 @@ class HHParser(HandHistoryParser):
     @cached_property
     def blinds(self):
         #returns dict {player: blind bet}
-        return self._process_regexp(self.BLINDS_REGEX,
-                                                 self.caption_str,
+        return self._process_matches(self._find(self.BLINDS_REGEX, 'caption'),
                                                  type_func=lambda x: int(x),
                                                  **self.BLINDS_ANTE_DICT)
 
@@ -852,19 +911,32 @@ class HHParser(HandHistoryParser):
     def antes(self):
         #returns dict {player: ante}
 
-        return self._process_regexp(self.ANTE_REGEX,
-                                                 self.caption_str,
+        return self._process_matches(self._find(self.ANTE_REGEX, 'caption'),
                                                  type_func=lambda x: int(x),
                                                  **self.BLINDS_ANTE_DICT)
 
     @cached_property
     def uncalled(self):
         #returns dict {player: bet}
-        return self._process_regexp(self.UNCALLED_REGEX,
-                                                 self.hand_history,
+        return self._process_matches(self._find(self.UNCALLED_REGEX),
                                                  type_func=lambda x: int(x),
                                                  **self.UNCALLED_DICT)
 
+    def actions_sequence(self, street):
+        """
+        actions of the street in the order they were made
+        :param street: preflop, flop, turn or river
+        :return: list of tuples (player, action, amount), amount is 0 for folds and checks
+        """
+        res = []
+        for m in self._find(self.ACTIONS_REGEX, street):
+            line_end = m.string.find('\n', m.end())
+            line = m.string[m.start():line_end if line_end >= 0 else len(m.string)]
+            amount = self.ACTIONS_AMOUNTS_REGEX.match(line)
+            amount = amount.group('amount') if amount else None
+            res.append((m.group('player'), ACTIONS[m.group('action')], int(amount) if amount else 0))
+        return res
+
     def positions(self):
         #returns dict{player: position}
         return {self.preflop_order[::-1][i]: self.POSITIONS[i] for i in range(len(self.preflop_order))}
@@ -892,64 +964,3 @@ class HHParser(HandHistoryParser):
             return self.f_actions_amounts()
         else:
             return self.p_actions_amounts()
-
-    def _process_regexp(
-            self,
-            pattern,
-            text,
-            *args,
-            type_func=lambda x: x,
-            reslist=False,
-            default_value=0,
-            **kwargs):
-        """
-
-        :param pattern: regex
-        :param text: text
-        :param args: list with group name to extract, if you want to extract values into list
-        :param type_func: function for type casting
-        :param reslist: boolean -> if you want to get dict with list values else same key will results will be added
-        :param default_value: for reslist
-        :param kwargs: dict with group names to extract
-        :return:
-        """
-        # extracts named groups from result of re and converts it into dict or list
-        it = re.finditer(pattern, text)
-
-        res = []
-        for x in args:
-            for i in it:
-                try:
-                    res.append(type_func(i.groupdict().get(x)))
-                except TypeError:
-                    res.append(i.groupdict().get(x))
-            if reslist:
-                return res
-            else:
-                return default_value if len(res) == 0 else res[0]
-        res = {}
-        for k, v in kwargs.items():
-            for i in it:
-                key = i.groupdict().get(k)
-                value = i.groupdict().get(v)
-                try:
-                    if reslist:
-                        if res.get(key):
-                            res[key].append(type_func(value))
-                        else:
-                            res[key] = [type_func(value)]
-                    else:
-                        if res.get(key):
-                            res[key] += type_func(value)
-                        else:
-                            res[key] = type_func(value)
-                except TypeError:
-                    if reslist:
-                        if res.get(key):
-                            res[key].append(value)
-                        else:
-                            res[key] = [value]
-                    else:
-                        res[key] = value
-            return res
-
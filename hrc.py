@@ -7,6 +7,7 @@ import re
 import pyperclip
 import time
 from itertools import chain
+from xwindows import XWindows
 
 def configure_logger():
 
@@ -24,49 +25,100 @@ logger = configure_logger()
 # TODO check if wmctrl and xdotool installed
 
 
+def wait_for(condition, timeout, name='condition', interval=0.05, max_interval=1.0):
+    """
+    polls condition with doubling interval until it is true, logs waiting time
+    :param condition: function without arguments
+    :param timeout: seconds
+    :param name: step name for log
+    :param interval: first polling interval in seconds
+    :param max_interval: maximal polling interval in seconds
+    :return: True if condition became true before timeout
+    """
+    start = time.monotonic()
+    while True:
+        if condition():
+            logger.debug(f'{name}: ready in {time.monotonic() - start:.2f} s')
+            return True
+        elapsed = time.monotonic() - start
+        if elapsed >= timeout:
+            logger.warning(f'{name}: timeout after {elapsed:.2f} s')
+            return False
+        time.sleep(min(interval, timeout - elapsed))
+        interval = min(interval * 2, max_interval)
+
+
 class HRCAuto:
     PROCESS_NAME = 'calculator'
     MAIN_WINDOW_TITLE = 'HoldemResources Calculator '
     BASIC_HAND_TITLE = 'Basic Hand Setup '
     CMD_ACTIVATE_MAIN = ['wmctrl', '-R', MAIN_WINDOW_TITLE]
     CMD_ACTIVATE_BASIC = ['wmctrl', '-R', BASIC_HAND_TITLE]
+    # commands don't wait for windows, every step is followed by wait_for of the window state
     CMD_BASIC_HAND = [
-        ['xdotool', 'key', 'ctrl+w', 'key', 'p', 'sleep', '2']
+        ['xdotool', 'key', 'ctrl+w', 'key', 'p']
     ]
     CMD_PASTE_CALCULATE = [[
         'xdotool', 'mousemove', '421', '617',
         'sleep', '0.5', 'click', '1', 'key', 'Tab', 'sleep', '0.5', 'key', 'Return',
-        'sleep', '2', 'key', 'Return', 'sleep', '2'
+        'sleep', '2', 'key', 'Return'
     ]]
     NAME = 'default'
     CMD_SAVE_DIALOG = [
-        ['xdotool', 'key', 'alt+h', 'sleep', '1', 'key', 'e', 'sleep', '1',
-         'key', 'Up', 'sleep', '1', 'key', 'Return', 'sleep', '3']]
+        ['xdotool', 'key', 'alt+h', 'sleep', '0.3', 'key', 'e', 'sleep', '0.3',
+         'key', 'Up', 'sleep', '0.3', 'key', 'Return']]
     CMD_RETURN_SAVE = [
-        ['xdotool', 'sleep', '1', 'key', 'Down', 'key', 'Down', 'key', 'Return', 'sleep', '2']]
+        ['xdotool', 'sleep', '0.3', 'key', 'Down', 'key', 'Down', 'key', 'Return']]
+
+    # step timeouts in seconds
+    START_TIMEOUT = 60
+    ACTIVATE_TIMEOUT = 2
+    WINDOW_TIMEOUT = 10
+    CALCULATE_TIMEOUT = 160
+    SAVE_TIMEOUT = 20
 
     CMD_CLOSE_TAB = [
         ['xdotool', 'key', 'ctrl+F4']
     ]
 
-    @staticmethod
-    def _find_procs_by_name(name):
-
+    def _find_procs_by_name(self, name):
+        # only processes on display of this instance if display is set
         ls = []
         for p in psutil.process_iter(attrs=['name']):
             if p.info['name'] == name:
+                if self.display is not None:
+                    try:
+                        if p.environ().get('DISPLAY') != self.display:
+                            continue
+                    except (psutil.AccessDenied, psutil.NoSuchProcess):
+                        continue
                 ls.append(p)
         return ls
 
-    @staticmethod
-    def _get_active_window_title():
-        root = subprocess.Popen(['xprop', '-root', '_NET_ACTIVE_WINDOW'], stdout=subprocess.PIPE)
+    def _is_hrc_running(self):
+        # pid of HRC is cached, process table is scanned only if it exited
+        if self._proc is not None and self._proc.is_running():
+            return True
+        procs = self._find_procs_by_name(self.PROCESS_NAME)
+        self._proc = procs[0] if procs else None
+        return self._proc is not None
+
+    def _activate(self):
+        if self._x is not None:
+            self._x.activate(self._cmd_activate[-1])
+        else:
+            self._run_command(self._cmd_activate)
+
+    def _get_active_window_title(self):
+        if self._x is not None:
+            return self._x.active_title()
+        root = subprocess.Popen(['xprop', '-root', '_NET_ACTIVE_WINDOW'], stdout=subprocess.PIPE, env=self._env)
         stdout, stderr = root.communicate()
 
         m = re.search(b'^_NET_ACTIVE_WINDOW.* ([\w]+)$', stdout)
         if m != None:
             window_id = m.group(1)
-            window = subprocess.Popen(['xprop', '-id', window_id, 'WM_NAME'], stdout=subprocess.PIPE)
+            window = subprocess.Popen(['xprop', '-id', window_id, 'WM_NAME'], stdout=subprocess.PIPE, env=self._env)
             stdout, stderr = window.communicate()
         else:
             return None
@@ -78,6 +130,7 @@ class HRCAuto:
         return None
 
     def _run_command(self, cmd, **kwargs):
+        kwargs.setdefault('env', self._env)
         root = subprocess.Popen(cmd, stdout=subprocess.PIPE, **kwargs)
         if kwargs.get('shell') is None:
             stdout, stderr = root.communicate()
@@ -95,8 +148,10 @@ class HRCAuto:
         except:
             self._errors.append('HRC opening error')
             raise RuntimeError('HRC opening error')
-        time.sleep(15)
+        wait_for(lambda: self._window_exists(self.MAIN_WINDOW_TITLE), self.START_TIMEOUT, 'HRC start')
         self._current_title = self.MAIN_WINDOW_TITLE
+        self._activate()
+        wait_for(self.is_active, self.ACTIVATE_TIMEOUT, 'activation')
 
     def is_active(self):
         if self._get_active_window_title() == self._current_title:
@@ -104,22 +159,60 @@ class HRCAuto:
         else:
             return False
 
+    def _window_exists(self, title):
+        # substring match of window titles like wmctrl -R, output of wmctrl is not collected as errors
+        if self._x is not None:
+            return self._x.find(title) is not None
+        res = subprocess.run(['wmctrl', '-l'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=self._env)
+        for line in res.stdout.decode('utf-8', errors='replace').splitlines():
+            # window id, desktop, host, title
+            fields = line.split(None, 3)
+            if len(fields) == 4 and title in fields[3]:
+                return True
+        return False
+
+    def _wait_step(self, name, condition, timeout):
+        # timeout of a step is an error, hand is calculated again
+        if not wait_for(condition, timeout, name):
+            self._errors.append(f'Timeout: {name}')
+
     def _run_command_list(self, cmdlist, activate=True):
         if isinstance(cmdlist, list):
             for cmd in cmdlist:
-                if self._find_procs_by_name(self.PROCESS_NAME):
+                if self._is_hrc_running():
                     if activate:
-                        self._run_command(self._cmd_activate)
+                        self._activate()
                     self._run_command(cmd)
                     self._last_cmd = cmd
                 else:
                     raise RuntimeError('HRC crashed!')
                     break
 
-    def __init__(self, hrc_path='/home/ant/holdemresources/calculator'):
+    def _copy(self, text):
+        # clipboard of the instance display, pyperclip uses display of the current process
+        if self.display is None:
+            pyperclip.copy(text)
+        else:
+            subprocess.run(['xclip', '-selection', 'clipboard'], input=text.encode('utf-8'), env=self._env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
 
+    def __init__(self, hrc_path='/home/ant/holdemresources/calculator', display=None):
+        """
+        :param hrc_path: path to HRC executable
+        :param display: X display like ':10' to run HRC on, DISPLAY of the current process if None
+        """
+        self.display = display
+        # environment of all commands, HRC and xdotool/wmctrl/xprop use display of the instance
+        self._env = None if display is None else dict(os.environ, DISPLAY=display)
         self._current_title = self.MAIN_WINDOW_TITLE
         self._cmd_activate = ['wmctrl', '-R', self._current_title]
+        self._proc = None
+        # one X connection for window queries if python-xlib is installed, xprop and wmctrl otherwise
+        self._x = None
+        try:
+            self._x = XWindows(display)
+        except Exception as e:
+            logger.info(f'xprop and wmctrl are used for window queries: {e!r}')
         self._last_cmd = []
         self._errors = []
         self._out = []
@@ -128,41 +221,52 @@ class HRCAuto:
         if not os.path.exists(self.hrc_path):
             raise ValueError('Invalid path to HRC')
 
-        self._run_command(self._cmd_activate)
-        time.sleep(1)
-        if not self.is_active():
+        self._activate()
+        if not wait_for(self.is_active, self.ACTIVATE_TIMEOUT, 'activation'):
             self._start_hrc()
             if self.check_errors() or not self.is_active():
                 raise ValueError('HRC opening error')
 
-    def calculate_basic(self, history, file_name):
+    @staticmethod
+    def _is_saved(file_name, since):
+        # html file written after since
+        html = os.path.expanduser(file_name) + '.html'
+        return os.path.exists(html) and os.path.getmtime(html) >= since - 1
+
+    def _calculate(self, file_name):
+        # calculates hand from clipboard and saves it, returns when file name is entered in save dialog
         cmd_type = [['xdotool', 'type', file_name]]
-        pyperclip.copy(history)
+        self._run_command_list(self.CMD_BASIC_HAND)
+        self._wait_step('basic hand window', self.is_calculating, self.WINDOW_TIMEOUT)
+        self._current_title = self.BASIC_HAND_TITLE
+        self._run_command_list(self.CMD_PASTE_CALCULATE)
+
+        # basic hand window is closed when calculation is done
+        self._wait_step('calculation', lambda: not self.is_calculating(), self.CALCULATE_TIMEOUT)
+
+        self._current_title = self.MAIN_WINDOW_TITLE
+        self._run_command_list(self.CMD_SAVE_DIALOG)
+        # save dialog becomes the active window
+        self._wait_step('save dialog', lambda: self._get_active_window_title() not in (
+            None, self.MAIN_WINDOW_TITLE), self.WINDOW_TIMEOUT)
+        cmd_save_close = chain(cmd_type, self.CMD_RETURN_SAVE)
+        self._run_command_list(list(cmd_save_close), activate=False)
+
+    def calculate_basic(self, history, file_name):
+        self._copy(history)
 
         for trials in range(0, 2):
 
             try:
                 # trying calculate hand 3 times if no errors loop breaks
                 self._current_title = self.MAIN_WINDOW_TITLE
-                self._run_command(self._cmd_activate)
+                self._activate()
                 if not self.is_active():
                     self._start_hrc()
 
-                self._run_command_list(self.CMD_BASIC_HAND)
-                self._current_title = self.BASIC_HAND_TITLE
-                self._run_command_list(self.CMD_PASTE_CALCULATE)
-
-                # loop waiting until calculatinon done
-                for i in range(0, 40):
-                    time.sleep(3)
-                    if not self.is_calculating():
-                        break
-
-                self._current_title = self.MAIN_WINDOW_TITLE
-                self._run_command_list(self.CMD_SAVE_DIALOG)
-                cmd_save_close = chain(cmd_type, self.CMD_RETURN_SAVE)
-
-                self._run_command_list(list(cmd_save_close), activate=False)
+                started = time.time()
+                self._calculate(file_name)
+                self._wait_step('saving', lambda: self._is_saved(file_name, started), self.SAVE_TIMEOUT)
                 self._run_command_list(self.CMD_CLOSE_TAB)
             except Exception as e:
                 self.check_errors()
@@ -176,13 +280,55 @@ class HRCAuto:
             else:
                 logger.error(f'Error while saving hand: {file_name}')
 
+    def calculate_batch(self, hands):
+        """
+        calculates hands one after another in one HRC session,
+        html files are written while next hands are calculated and are checked after the last hand,
+        hands not saved are calculated again with calculate_basic, which restarts HRC if it crashed
+        :param hands: list of tuples (hand history, file name)
+        :return: dict {file name: True if html file was saved}
+        """
+        started = time.time()
+        self._current_title = self.MAIN_WINDOW_TITLE
+        self._activate()
+        if not self.is_active():
+            self._start_hrc()
+
+        failed = set()
+        for history, file_name in hands:
+            try:
+                self._copy(history)
+                self._calculate(file_name)
+                # tab is closed as soon as save dialog is closed
+                self._wait_step('save dialog closed', self.is_active, self.WINDOW_TIMEOUT)
+                self._run_command_list(self.CMD_CLOSE_TAB)
+            except Exception as e:
+                logger.error(e.args)
+                failed.add(file_name)
+            if self.check_errors():
+                logger.error(f'Error while saving hand: {file_name}')
+                failed.add(file_name)
+            if not self._is_hrc_running():
+                # files not written yet will never appear, hands are calculated again after HRC restart
+                logger.error('HRC crashed, batch is stopped')
+                failed.update(fn for _, fn in hands if not self._is_saved(fn, started))
+                break
+
+        wait_for(lambda: all(self._is_saved(fn, started) for _, fn in hands if fn not in failed),
+                 self.SAVE_TIMEOUT, 'batch saving')
+        res = {}
+        for history, file_name in hands:
+            res[file_name] = self._is_saved(file_name, started)
+            if res[file_name]:
+                logger.info(f'Hand: {file_name} saved')
+            else:
+                self.calculate_basic(history, file_name)
+                res[file_name] = self._is_saved(file_name, started)
+        return res
+
     def is_calculating(self):
-        self._run_command(self.CMD_ACTIVATE_BASIC)
-        time.sleep(1)
-        if self._get_active_window_title() == self.BASIC_HAND_TITLE:
-            return True
-        else:
-            return False
+        # basic hand window is open
+        return self._window_exists(self.BASIC_HAND_TITLE)
 
     def check_errors(self):
         """
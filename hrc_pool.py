@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of HRC instances running on virtual X displays.
+
+Every instance gets its own Xvfb display with a window manager (wmctrl and
+xprop need EWMH support) and its own HRCAuto bound to that display, so
+instances don't share active window and clipboard.
+Requires Xvfb, xclip and a window manager (openbox by default) to be installed.
+"""
+import logging
+import os
+import subprocess
+import time
+
+from hrc import HRCAuto
+
+logger = logging.getLogger(__name__)
+
+FIRST_DISPLAY = 10
+SCREEN = '1280x1024x24'
+WINDOW_MANAGER = ['openbox']
+# seconds to wait for Xvfb to create display socket
+START_TIMEOUT = 10
+
+
+class XvfbDisplay:
+    """
+    virtual X display with window manager, usage:
+    with XvfbDisplay(10) as display:
+        calc = HRCAuto(display=display.name)
+    """
+
+    def __init__(self, number, screen=SCREEN, window_manager=WINDOW_MANAGER):
+        self.number = number
+        self.name = f':{number}'
+        self.screen = screen
+        self.window_manager = window_manager
+        self._xvfb = None
+        self._wm = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        socket = f'/tmp/.X11-unix/X{self.number}'
+        if os.path.exists(socket):
+            raise RuntimeError(f'Display {self.name} is already in use')
+
+        self._xvfb = subprocess.Popen(['Xvfb', self.name, '-screen', '0', self.screen, '-nolisten', 'tcp'],
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + START_TIMEOUT
+        while not os.path.exists(socket):
+            if self._xvfb.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f'Xvfb {self.name} starting error')
+            time.sleep(0.1)
+
+        if self.window_manager:
+            self._wm = subprocess.Popen(self.window_manager, env=dict(os.environ, DISPLAY=self.name),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        logger.info(f'Display {self.name} started')
+
+    def stop(self):
+        for proc in (self._wm, self._xvfb):
+            if proc is not None and proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        self._wm = self._xvfb = None
+
+
+class HRCPool:
+    """
+    starts size displays with HRC on each, usage:
+    with HRCPool(4) as pool:
+        Stage('calculate', calculate_hands, calc_q, result_q, batch_size=10).start(
+            len(pool.instances), [(calc, ) for calc in pool.instances])
+    stage threads take hands from the same priority queue, so hands are dispatched to free instances
+    """
+
+    def __init__(self, size, hrc_path='/home/ant/holdemresources/calculator', first_display=FIRST_DISPLAY,
+                 screen=SCREEN, window_manager=WINDOW_MANAGER):
+        self.size = size
+        self.hrc_path = hrc_path
+        self.first_display = first_display
+        self.screen = screen
+        self.window_manager = window_manager
+        self.displays = []
+        self.instances = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        try:
+            for n in range(self.size):
+                display = XvfbDisplay(self.first_display + n, self.screen, self.window_manager)
+                display.start()
+                self.displays.append(display)
+                self.instances.append(HRCAuto(self.hrc_path, display=display.name))
+        except Exception:
+            self.close()
+            raise
+        return self.instances
+
+    def close(self):
+        # HRC exits with its display
+        for display in self.displays:
+            display.stop()
+        self.displays.clear()
+        self.instances.clear()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Independent Chip Model (Malmuth-Harville) calculations.
+
+Finish probabilities are computed by dynamic programming over bitmasks of
+the players still left in the tournament instead of enumerating every
+finishing order, so a full table costs O(2^n * n) rather than O(n! * n^2).
+"""
+import numpy as np
+
+# bigger tables are evaluated with sampling by icm_equity
+EXACT_MAX_PLAYERS = 12
+MC_SAMPLES = 100000
+MC_CHUNK_SIZE = 10000
+
+
+def place_probabilities(stacks, places=None):
+    """
+    probabilities of finishing places for every player
+    :param stacks: list of stacks or 2d array, one row of stacks per scenario
+    :param places: number of places to calculate, all places if None
+    :return: np.array (places, players), row - place, column - player,
+        or (scenarios, places, players) for 2d stacks
+    """
+    s = np.asarray(stacks, dtype=float)
+    single = s.ndim == 1
+    s = np.atleast_2d(s)
+    batch, sz = s.shape
+    places = sz if places is None else min(places, sz)
+    result = np.zeros(shape=(batch, places, sz))
+
+    # probability of every subset of players still playing when the place is decided
+    # subset is a bitmask, i-th bit set if player i is still in the tournament,
+    # all scenarios share the same subsets so they are evaluated together
+    level = {(1 << sz) - 1: np.ones(batch)}
+    for place in range(places):
+        next_level = {}
+        for mask, prob in level.items():
+            players = [i for i in range(sz) if mask >> i & 1]
+            total = s[:, players].sum(axis=1)
+            # only busted players left, they share the places equally
+            busted = total <= 0
+            share = np.where(busted, prob / len(players), 0.0)
+            ratio = np.where(busted, 0.0, prob / np.where(busted, 1.0, total))
+            for i in players:
+                pi = ratio * s[:, i] + share
+                result[:, place, i] += pi
+                rest = mask & ~(1 << i)
+                if rest in next_level:
+                    next_level[rest] += pi
+                else:
+                    next_level[rest] = pi
+        level = next_level
+
+    return result[0] if single else result
+
+
+def icm_eq(stacks, prizes):
+    """
+    ICM equity of every player
+    :param stacks: list of stacks or 2d array, one row of stacks per scenario
+    :param prizes: list of prizes, 1st place first
+    :return: np.array with equity for every player, one row per scenario for 2d stacks
+    """
+    prizes = np.asarray(prizes, dtype=float)
+    min_place = min(np.shape(stacks)[-1], np.size(prizes))
+    return np.dot(prizes[:min_place], place_probabilities(stacks, min_place))
+
+
+def icm_eq_mc(stacks, prizes, samples=MC_SAMPLES, seed=None, chunk_size=MC_CHUNK_SIZE):
+    """
+    ICM equity estimated by sampling Malmuth-Harville finishing orders
+    finishing order is sampled as exponential race: player with the smallest
+    Exp(1) / stack key wins, so the probability to take every next place is
+    proportional to the stack as in the exact model
+    :param stacks: list of stacks
+    :param prizes: list of prizes, 1st place first
+    :param samples: number of sampled finishing orders
+    :param seed: seed of random generator
+    :param chunk_size: number of orders sampled at once, limits memory usage
+    :return: tuple (np.array with equity, np.array with standard error)
+    """
+    s = np.asarray(stacks, dtype=float)
+    sz = np.size(s)
+    prizes = np.asarray(prizes, dtype=float)
+    # prize for every finishing place, places out of money pay 0
+    payout = np.zeros(sz)
+    min_place = min(sz, np.size(prizes))
+    payout[:min_place] = prizes[:min_place]
+
+    rng = np.random.RandomState(seed)
+    busted = s <= 0
+    total = np.zeros(sz)
+    total_sq = np.zeros(sz)
+    done = 0
+    while done < samples:
+        n = min(chunk_size, samples - done)
+        with np.errstate(divide='ignore'):
+            keys = rng.exponential(size=(n, sz)) / s
+        if busted.any():
+            # busted players finish last in random order
+            order = np.lexsort((rng.random_sample((n, sz)), keys), axis=-1)
+        else:
+            order = np.argsort(keys, axis=1)
+        # order[k, place] - player, values[k, player] - prize
+        values = np.empty((n, sz))
+        np.put_along_axis(values, order, payout[np.newaxis, :], axis=1)
+        total += values.sum(axis=0)
+        total_sq += (values ** 2).sum(axis=0)
+        done += n
+
+    eq = total / samples
+    if samples > 1:
+        var = np.maximum(total_sq - samples * eq ** 2, 0) / (samples - 1)
+        stderr = np.sqrt(var / samples)
+    else:
+        stderr = np.full(sz, np.inf)
+    return eq, stderr
+
+
+def icm_equity(stacks, prizes, method='auto', samples=MC_SAMPLES, seed=None):
+    """
+    ICM equity with exact or sampling engine
+    :param stacks: list of stacks
+    :param prizes: list of prizes, 1st place first
+    :param method: 'exact', 'mc' or 'auto' - exact up to EXACT_MAX_PLAYERS players
+    :param samples: number of samples for 'mc'
+    :param seed: seed of random generator for 'mc'
+    :return: tuple (np.array with equity, np.array with standard error), error is 0 for exact
+    """
+    if method == 'auto':
+        method = 'exact' if np.size(stacks) <= EXACT_MAX_PLAYERS else 'mc'
+
+    if method == 'exact':
+        eq = icm_eq(stacks, prizes)
+        return eq, np.zeros(np.size(eq))
+    elif method == 'mc':
+        return icm_eq_mc(stacks, prizes, samples=samples, seed=seed)
+    else:
+        raise ValueError(f'Unknown ICM method: {method}')
+
+
+def bubble_factors(stacks, prizes):
+    """
+    bubble factors of every pair of players
+    all win and lose scenarios are evaluated in one batch
+    :param stacks: list of stacks
+    :param prizes: list of prizes, 1st place first
+    :return: np.array (players, players), bubble factor of player i (row)
+        calling all in against player j (column), diagonal is 0
+    """
+    st = np.asarray(stacks, dtype=float)
+    sz = np.size(st)
+    pairs = [(i, j) for i in range(sz) for j in range(sz) if i != j]
+
+    # row 0 - current stacks, then win and lose scenario for every pair
+    scenarios = np.tile(st, (1 + 2 * len(pairs), 1))
+    for n, (i, j) in enumerate(pairs):
+        win = scenarios[1 + 2 * n]
+        lose = scenarios[2 + 2 * n]
+        if st[i] > st[j]:
+            win[i] = st[i] + st[j]
+            win[j] = 0
+            lose[i] = st[i] - st[j]
+            lose[j] = st[j] * 2
+        else:
+            win[i] = st[i] * 2
+            win[j] = st[j] - st[i]
+            lose[i] = 0
+            lose[j] = st[i] + st[j]
+
+    eq_all = np.atleast_2d(icm_eq(scenarios, prizes))
+    eq = eq_all[0]
+    result = np.zeros((sz, sz))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for n, (i, j) in enumerate(pairs):
+            eq_win = eq_all[1 + 2 * n, i]
+            eq_lose = eq_all[2 + 2 * n, i]
+            result[i, j] = (eq[i] - eq_lose) / (eq_win - eq[i])
+
+    return result
+
+
+def tie_factors(stacks, prizes):
+    """
+    risk premium of every pair of players: bf / (1 + bf)
+    :param stacks: list of stacks
+    :param prizes: list of prizes, 1st place first
+    :return: np.array (players, players)
+    """
+    bf = bubble_factors(stacks, prizes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = bf / (1 + bf)
+    np.fill_diagonal(result, 0)
+    return result
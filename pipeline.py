@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Stages of hand processing connected by bounded queues.
+
+Every stage runs in its own threads, takes tasks from its input queue and puts
+finished tasks into the next queue. A full queue blocks the previous stage
+(backpressure). Failed tasks are retried with a delay and are passed to the
+dead letter function after the last attempt.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from queue import Empty
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 5.0
+
+
+class Task:
+    """
+    hand passing through the pipeline, tasks are ordered by priority then by sequence number
+    """
+    __slots__ = ('priority', 'seq', 'hand', 'result_path', 'names', 'parsed_hrc', 'hero_ev', 'ranges',
+                 'cached', 'attempts')
+
+    def __init__(self, priority, seq, hand):
+        self.priority = priority
+        self.seq = seq
+        # parsed hand
+        self.hand = hand
+        self.result_path = None
+        # dict {player: player in hrc output} if result is taken from equivalent spot
+        self.names = None
+        self.parsed_hrc = None
+        self.hero_ev = None
+        self.ranges = None
+        # result is taken from spot cache
+        self.cached = False
+        # stage name -> number of failed attempts
+        self.attempts = Counter()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Stage:
+    """
+    usage:
+    stage = Stage('calculate', calculate, in_q, out_q, batch_size=10)
+    stage.start()
+    func takes list of tasks and extra arguments of the thread, returns list of tuples (task, exception or None)
+    """
+
+    def __init__(self, name, func, in_q, out_q=None, dead_letter=None, batch_size=1,
+                 max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY):
+        """
+        :param name: stage name for log and attempts counter
+        :param func: function func(tasks, *args) -> list of tuples (task, exception or None)
+        :param in_q: input queue
+        :param out_q: queue for finished tasks, None for the last stage
+        :param dead_letter: function dead_letter(task, stage name, exception) for tasks failed max_attempts times
+        :param batch_size: maximal number of tasks already queued passed to func at once
+        :param max_attempts: number of attempts of every task
+        :param retry_delay: seconds before failed task is queued again
+        """
+        self.name = name
+        self.func = func
+        self.in_q = in_q
+        self.out_q = out_q
+        self.dead_letter = dead_letter
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.threads = []
+
+    def start(self, workers=1, args=()):
+        """
+        starts worker threads
+        :param workers: number of threads
+        :param args: list of extra arguments of func for every thread, e.g. HRC instance
+        """
+        for n in range(workers):
+            thread = threading.Thread(target=self.run, args=args[n] if args else (), name=f'{self.name}-{n}')
+            thread.start()
+            self.threads.append(thread)
+
+    def _take(self):
+        # waits for a task and takes tasks already queued up to batch_size
+        tasks = [self.in_q.get()]
+        while len(tasks) < self.batch_size:
+            try:
+                tasks.append(self.in_q.get_nowait())
+            except Empty:
+                break
+        return tasks
+
+    def run(self, *args):
+        while True:
+            tasks = self._take()
+            start = time.monotonic()
+            try:
+                results = self.func(tasks, *args)
+            except Exception as e:
+                logger.exception(f'{self.name}: stage error')
+                results = [(task, e) for task in tasks]
+            logger.debug(f'{self.name}: {len(tasks)} tasks in {time.monotonic() - start:.2f} s')
+
+            for task, error in results:
+                if error is None:
+                    if self.out_q is not None:
+                        self.out_q.put(task)
+                else:
+                    self._failed(task, error)
+
+    def _failed(self, task, error):
+        task.attempts[self.name] += 1
+        attempts = task.attempts[self.name]
+        if attempts < self.max_attempts:
+            logger.warning(f'{self.name}: attempt {attempts} failed: {error!r}')
+            # queued from timer thread, the stage doesn't block on its own full queue
+            timer = threading.Timer(self.retry_delay, self.in_q.put, (task, ))
+            timer.daemon = True
+            timer.start()
+        else:
+            logger.error(f'{self.name}: task failed {attempts} times: {error!r}')
+            if self.dead_letter is not None:
+                self.dead_letter(task, self.name, error)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Priorities of hands for calculation queue, lower priority is calculated first.
+
+Hero all-in and calls of all-ins come first, then hands with big bounties
+and high ICM pressure (bubble factor of hero, depends on players remaining
+and paid places). Hands where hero just folded preflop are skipped or deferred.
+"""
+import numpy as np
+
+import icm
+
+PRIORITY_DEFAULT = 10.0
+# priority of hero preflop folds if they are not skipped
+PRIORITY_FOLD = 100.0
+# priority decrease for hand features
+HERO_ALL_IN = 4.0
+FACED_ALL_IN = 2.0
+BOUNTY = 2.0
+ICM_PRESSURE = 2.0
+
+
+def hero_bubble_factor(parsed_hand):
+    """
+    the largest bubble factor of hero against other players, 1 without ICM pressure
+    """
+    players = parsed_hand.players
+    if parsed_hand.hero not in players or len(players) < 2:
+        return 1.0
+    bf = icm.bubble_factors(parsed_hand.stack_list(), parsed_hand.PRIZE)[players.index(parsed_hand.hero)]
+    # players in the money have infinite or undefined factors
+    bf = bf[np.isfinite(bf) & (bf > 0)]
+    return float(bf.max()) if bf.size else 1.0
+
+
+def preflop_sequence(parsed_hand):
+    """
+    players in order of their preflop actions, every player acts once in every round around the table
+    in preflop order until he folds or is all in, so the order is restored from p_actions
+    :param parsed_hand: HHParser
+    :return: list of players, player is repeated for every action
+    """
+    actions = parsed_hand.p_actions or {}
+    order = [x for x in parsed_hand.preflop_order if actions.get(x)]
+    res = []
+    for n in range(max((len(actions[x]) for x in order), default=0)):
+        res.extend(x for x in order if len(actions[x]) > n)
+    return res
+
+
+def faced_all_in(parsed_hand):
+    """
+    players all in preflop before the last preflop action of hero, shoves made after hero folded are not counted
+    :param parsed_hand: HHParser
+    :return: list of players
+    """
+    hero = parsed_hand.hero
+    all_in = parsed_hand.p_ai_players or []
+    if not all_in:
+        return []
+    sequence = preflop_sequence(parsed_hand)
+    if hero not in sequence:
+        return []
+    hero_last = len(sequence) - 1 - sequence[::-1].index(hero)
+    # all in is the last action of the player
+    return [player for player in all_in
+            if player != hero and player in sequence
+            and len(sequence) - 1 - sequence[::-1].index(player) < hero_last]
+
+
+def hand_priority(parsed_hand, skip_folds=True):
+    """
+    priority of hand calculation
+    :param parsed_hand: HHParser
+    :param skip_folds: don't calculate hands where hero folded preflop without facing all in
+    :return: priority, lower is calculated first, None if hand should not be calculated
+    """
+    hero = parsed_hand.hero
+    faced = faced_all_in(parsed_hand)
+    if parsed_hand.p_actions.get(hero) == ['f'] and not faced:
+        return None if skip_folds else PRIORITY_FOLD
+
+    priority = PRIORITY_DEFAULT
+    if hero in (parsed_hand.p_ai_players or []):
+        priority -= HERO_ALL_IN
+    elif faced:
+        priority -= FACED_ALL_IN
+
+    bi = parsed_hand.bi
+    if parsed_hand.bounty and bi:
+        priority -= BOUNTY * min(parsed_hand.bounty / bi, 1)
+
+    priority -= ICM_PRESSURE * min(hero_bubble_factor(parsed_hand) - 1, 1)
+    return priority
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of HRC results for equivalent spots.
+
+HRC result depends only on stacks, blinds, antes and payouts, so hands with the same
+stacks in big blinds in the same preflop order are answered with the result of the
+first such hand. Player names of HRC strategies are translated by preflop position.
+"""
+import threading
+from collections import OrderedDict
+
+# stacks are rounded to multiples of BUCKET_BB big blinds, 0 - exact stacks
+BUCKET_BB = 0
+MAX_SPOTS = 1000
+
+
+def spot_key(parsed_hand, bucket=BUCKET_BB):
+    """
+    canonical spot of the hand
+    :param parsed_hand: HHParser
+    :param bucket: tolerance of stacks in big blinds, stacks are compared with 0.01 bb precision if 0
+    :return: tuple (stacks in preflop order, sb, ante, prizes, bounty) with amounts in big blinds,
+        None if blinds are unknown
+    """
+    bb = parsed_hand.bb
+    if not bb:
+        return None
+    step = bucket or 0.01
+    stacks = parsed_hand.stacks()
+    antes = parsed_hand.antes or {}
+    bi = parsed_hand.bi
+    return (
+        tuple(round(stacks[player] / bb / step) for player in parsed_hand.preflop_order),
+        round(parsed_hand.sb / bb, 3),
+        round(max(antes.values(), default=0) / bb, 3),
+        tuple(round(float(x), 4) for x in parsed_hand.PRIZE),
+        round((parsed_hand.bounty or 0) / bi, 3) if bi else 0.0,
+    )
+
+
+class SpotCache:
+    """
+    thread safe LRU cache {spot: (result path, parsed HRC output, players in preflop order)}
+    """
+
+    def __init__(self, max_spots=MAX_SPOTS, bucket=BUCKET_BB):
+        self.max_spots = max_spots
+        self.bucket = bucket
+        self.hits = 0
+        self.misses = 0
+        self._spots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._spots)
+
+    def get(self, parsed_hand):
+        """
+        :param parsed_hand: HHParser
+        :return: tuple (result path, parsed HRC output, dict {player: player of the cached hand}) or None
+        """
+        key = spot_key(parsed_hand, self.bucket)
+        if key is None:
+            return None
+        with self._lock:
+            res = self._spots.get(key)
+            if res is None:
+                self.misses += 1
+                return None
+            self._spots.move_to_end(key)
+            self.hits += 1
+        result_path, parsed_hrc, players = res
+        return result_path, parsed_hrc, dict(zip(parsed_hand.preflop_order, players))
+
+    def put(self, parsed_hand, result_path, parsed_hrc):
+        key = spot_key(parsed_hand, self.bucket)
+        if key is None:
+            return
+        with self._lock:
+            self._spots[key] = (result_path, parsed_hrc, list(parsed_hand.preflop_order))
+            self._spots.move_to_end(key)
+            while len(self._spots) > self.max_spots:
+                self._spots.popitem(last=False)
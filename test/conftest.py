@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of tests, modules are imported from the repository root.
+"""
+import glob
+import os
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+CORPUS_DIR = os.path.join(BASE_DIR, '10')
+
+
+@pytest.fixture(scope='session')
+def corpus_files():
+    return sorted(glob.glob(os.path.join(CORPUS_DIR, '*.txt')))
+
+
+@pytest.fixture(scope='session')
+def corpus_hands(corpus_files):
+    from hand_storage import split_hands
+    return [hand for file in corpus_files for _, hand in split_hands(file)]
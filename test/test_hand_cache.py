@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+import pytest
+
+import bulk_import
+from hand_cache import HandCache
+
+
+class CountingParser:
+    # bulk_import.parse_file remembering offsets parsing started from
+    def __init__(self):
+        self.offsets = []
+
+    def __call__(self, file, offset=0):
+        self.offsets.append(offset)
+        return bulk_import.parse_file(file, offset)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HandCache(str(tmp_path / 'cache.sqlite'))
+    yield cache
+    cache.close()
+
+
+def records_of(file):
+    return [record for _, record in bulk_import.parse_file(file)[0]]
+
+
+def test_unchanged_file_is_not_parsed(cache, corpus_files, tmp_path):
+    file = str(tmp_path / 'hands.txt')
+    shutil.copy(corpus_files[0], file)
+    parse = CountingParser()
+    first = cache.read(file, parse)
+    assert first == records_of(file)
+    assert cache.read(file, parse) == first
+    assert parse.offsets == [0]
+
+
+def test_appended_file_is_parsed_from_last_hand(cache, corpus_files, tmp_path):
+    file = str(tmp_path / 'hands.txt')
+    shutil.copy(corpus_files[0], file)
+    parse = CountingParser()
+    before = cache.read(file, parse)
+    with open(corpus_files[1], 'rb') as src, open(file, 'ab') as f:
+        f.write(b'\n\n\n' + src.read())
+    after = cache.read(file, parse)
+    assert after == records_of(file)
+    assert len(after) == len(before) + len(records_of(corpus_files[1]))
+    # the last cached hand is parsed again, it could be incomplete
+    assert parse.offsets[1] > 0
+
+
+def test_rewritten_file_is_invalidated(cache, corpus_files, tmp_path):
+    file = str(tmp_path / 'hands.txt')
+    shutil.copy(corpus_files[0], file)
+    parse = CountingParser()
+    cache.read(file, parse)
+    # longer file with different beginning is not an append
+    with open(corpus_files[2], 'rb') as a, open(corpus_files[0], 'rb') as b, open(file, 'wb') as f:
+        f.write(a.read() + b'\n\n\n' + b.read())
+    assert cache.read(file, parse) == records_of(file)
+    assert parse.offsets == [0, 0]
+
+
+def test_truncated_file_is_invalidated(cache, corpus_files, tmp_path):
+    file = str(tmp_path / 'hands.txt')
+    shutil.copy(corpus_files[1], file)
+    parse = CountingParser()
+    cache.read(file, parse)
+    shutil.copy(corpus_files[0], file)
+    os.utime(file, ns=(0, 0))
+    assert cache.read(file, parse) == records_of(corpus_files[0])
+    assert parse.offsets == [0, 0]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from hand_index import HandIndex, hand_ids, QUEUED, DONE, FAILED, SKIPPED
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'index.sqlite')
+
+
+def test_hand_ids(corpus_hands):
+    hid, tid = hand_ids(corpus_hands[0])
+    assert str(hid) in corpus_hands[0] and str(tid) in corpus_hands[0]
+    assert hand_ids('no hand') == (None, None)
+
+
+def test_queue_once_per_run(path):
+    index = HandIndex(path)
+    assert index.queue(1, 10)
+    assert not index.queue(1, 10)
+    index.skip(2, 10)
+    assert not index.queue(2, 10)
+    assert index.is_done(2)
+    index.done(1, 'result', 0.5)
+    assert index.is_done(1)
+    assert not index.queue(1, 10)
+    assert index.get(1)['ev'] == 0.5
+
+
+def test_restart(path):
+    index = HandIndex(path)
+    for hid in (1, 2, 3, 4):
+        index.queue(hid)
+    index.done(1, 'result')
+    index.failed(2, 'error')
+    index.skip(3)
+    index.close()
+
+    time.sleep(0.01)
+    index = HandIndex(path)
+    assert [index.status(x) for x in (1, 2, 3, 4)] == [DONE, FAILED, SKIPPED, QUEUED]
+    # hands not finished before restart are queued again, finished are not
+    assert not index.queue(1)
+    assert index.queue(2)
+    assert not index.queue(3)
+    assert index.queue(4)
+    assert not index.queue(4)
+
+
+def test_checkpoint(path):
+    index = HandIndex(path)
+    assert index.checkpoint() is None
+    for hid in (1, 2, 3):
+        index.queue(hid)
+        time.sleep(0.01)
+    queued_at = {x: index.get(x)['queued_at'] for x in (1, 2, 3)}
+    assert index.checkpoint() == queued_at[1]
+    # failed hands don't hold the checkpoint, the oldest unfinished hand does
+    index.failed(1, 'error')
+    assert index.checkpoint() == queued_at[2]
+    index.done(2, 'result')
+    index.done(3, 'result')
+    # the last queued hand if all hands are finished
+    assert index.checkpoint() == queued_at[3]
+    index.close()
+    assert HandIndex(path).checkpoint() == queued_at[3]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+from hand_storage import split_hands, HandTail
+
+
+def hands_of(file):
+    return [hand for _, hand in split_hands(file)]
+
+
+def test_tail_partial_appends(corpus_files, tmp_path):
+    source = corpus_files[1]
+    with open(source, 'rb') as f:
+        data = f.read()
+    expected = [hand for _, hand in split_hands(source)]
+
+    file = str(tmp_path / 'hands.txt')
+    open(file, 'wb').close()
+    tail = HandTail()
+    res = []
+    # file grows by pieces cut in the middle of lines and hands
+    for start in range(0, len(data), 333):
+        with open(file, 'ab') as f:
+            f.write(data[start:start + 333])
+        res.extend(hand for _, hand in tail.read(file))
+    res.extend(hand for _, hand in tail.read(file, final=True))
+    assert res == expected
+    assert tail.read(file, final=True) == []
+
+
+def test_tail_truncate_and_replace(corpus_files, tmp_path):
+    first, second = corpus_files[:2]
+    file = str(tmp_path / 'hands.txt')
+    shutil.copy(first, file)
+    tail = HandTail()
+    assert len(tail.read(file, final=True)) == len(hands_of(first))
+
+    # truncated and written again
+    with open(second, 'rb') as src, open(file, 'wb') as f:
+        f.write(src.read())
+    assert [hand for _, hand in tail.read(file, final=True)] == hands_of(second)
+
+    # replaced by another file
+    replacement = str(tmp_path / 'new.txt')
+    shutil.copy(first, replacement)
+    os.replace(replacement, file)
+    assert [hand for _, hand in tail.read(file, final=True)] == hands_of(first)
+
+
+def test_tail_seek_skips_existing(corpus_files, tmp_path):
+    file = str(tmp_path / 'hands.txt')
+    shutil.copy(corpus_files[0], file)
+    tail = HandTail()
+    tail.seek(file)
+    assert tail.read(file, final=True) == []
+    with open(corpus_files[1], 'rb') as src, open(file, 'ab') as f:
+        f.write(b'\n\n\n' + src.read())
+    assert [hand for _, hand in tail.read(file, final=True)] == hands_of(corpus_files[1])
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from hhparser import HHParser, STREETS, cached_property
+
+PROPERTIES = sorted(k for klass in HHParser.__mro__ for k, v in vars(klass).items()
+                    if isinstance(v, cached_property))
+
+
+@pytest.fixture(scope='module')
+def parsers(corpus_hands):
+    return [(HHParser(hand), HHParser(hand, single_pass=True)) for hand in corpus_hands]
+
+
+def test_single_pass_properties_match_regex(parsers):
+    for regex, single in parsers:
+        for name in PROPERTIES:
+            assert getattr(single, name) == getattr(regex, name), (regex.hid, name)
+
+
+def test_single_pass_init_matches_regex(parsers):
+    for regex, single in parsers:
+        assert single.players == regex.players
+        assert single.preflop_order == regex.preflop_order
+        assert (single.sb, single.bb) == (regex.sb, regex.bb)
+        assert single.stack_list() == regex.stack_list()
+
+
+def test_matches_are_dropped_after_all_properties(corpus_hands):
+    parsed = HHParser(corpus_hands[0], single_pass=True)
+    assert parsed._matches is not None
+    for name in PROPERTIES:
+        getattr(parsed, name)
+    assert parsed._matches is None
+    # methods fall back to regular expressions
+    regex = HHParser(corpus_hands[0])
+    for street in ('preflop', 'flop', 'turn', 'river'):
+        assert parsed.actions_sequence(street) == regex.actions_sequence(street)
+
+
+def test_actions_sequence_single_pass(parsers):
+    for regex, single in parsers[:300]:
+        fresh = HHParser(regex.hand_history, single_pass=True)
+        for street in ('preflop', 'flop', 'turn', 'river'):
+            assert fresh.actions_sequence(street) == regex.actions_sequence(street)
+
+
+def test_sections_split_on_access(corpus_hands):
+    parsed = HHParser(corpus_hands[0], single_pass=True)
+    assert 'preflop_str' not in parsed.__dict__
+    regex = HHParser(corpus_hands[0])
+    for _, name in STREETS:
+        assert getattr(parsed, f'{name}_str') == getattr(regex, f'{name}_str')
+    with pytest.raises(AttributeError):
+        parsed.unknown_str
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+import numpy as np
+import pytest
+
+import icm
+
+
+def brute_force_eq(stacks, prizes):
+    # Malmuth-Harville equity by enumerating every finishing order
+    sz = len(stacks)
+    eq = np.zeros(sz)
+    for order in itertools.permutations(range(sz)):
+        prob = 1.0
+        left = float(sum(stacks))
+        for player in order:
+            prob *= stacks[player] / left
+            left -= stacks[player]
+        for place, player in enumerate(order[:len(prizes)]):
+            eq[player] += prob * prizes[place]
+    return eq
+
+
+@pytest.mark.parametrize('stacks, prizes', [
+    ([500, 500], [1.0]),
+    ([1000, 1500, 2000, 500], [0.5, 0.3, 0.2]),
+    ([1431, 298, 2210, 873, 1188, 3000], [0.65, 0.35]),
+    ([120, 4000, 35, 980, 2200], [0.5, 0.3, 0.2, 0.1, 0.05]),
+])
+def test_dp_matches_permutations(stacks, prizes):
+    assert np.allclose(icm.icm_eq(stacks, prizes), brute_force_eq(stacks, prizes))
+
+
+def test_place_probabilities_sum_to_one():
+    probs = icm.place_probabilities([1000, 1500, 2000, 500, 300])
+    assert np.allclose(probs.sum(axis=0), 1)
+    assert np.allclose(probs.sum(axis=1), 1)
+
+
+def test_batch_matches_single_scenarios():
+    scenarios = np.array([[1000, 1500, 2000], [3000, 1000, 500], [0, 2500, 2000]])
+    prizes = [0.5, 0.3, 0.2]
+    batch = icm.icm_eq(scenarios, prizes)
+    for row, eq in zip(scenarios, batch):
+        assert np.allclose(eq, icm.icm_eq(row, prizes))
+
+
+def test_mc_within_stderr():
+    stacks = [1000, 1500, 2000, 500, 800, 1200]
+    prizes = [0.5, 0.3, 0.2]
+    exact = icm.icm_eq(stacks, prizes)
+    eq, stderr = icm.icm_eq_mc(stacks, prizes, samples=200000, seed=1)
+    assert np.all(np.abs(eq - exact) < 5 * stderr)
+
+
+def test_equity_methods():
+    stacks = [1000, 1500, 2000]
+    prizes = [0.65, 0.35]
+    eq, stderr = icm.icm_equity(stacks, prizes)
+    assert np.allclose(eq, brute_force_eq(stacks, prizes))
+    assert not stderr.any()
+    with pytest.raises(ValueError):
+        icm.icm_equity(stacks, prizes, method='unknown')
+
+
+def test_bubble_factors_heads_up_without_icm():
+    # winner takes all, chips are linear in equity
+    bf = icm.bubble_factors([1000, 2000], [1.0])
+    assert np.allclose(bf, [[0, 1], [1, 0]])
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from hhparser import HHParser
+from scheduler import hand_priority, faced_all_in, preflop_sequence, PRIORITY_DEFAULT
+
+# hero folded before the all in, the shove came later
+FOLD_BEFORE_SHOVE = '189830285820'
+
+
+class PackageParser:
+    # HHParser without methods missing in poker.parsers.hhparser used by watcher
+    MISSING = ('actions_sequence', )
+
+    def __init__(self, parsed):
+        self._parsed = parsed
+
+    def __getattr__(self, name):
+        if name in self.MISSING:
+            raise AttributeError(name)
+        return getattr(self._parsed, name)
+
+
+@pytest.fixture(scope='module')
+def parsed_hands(corpus_hands):
+    return [HHParser(hand) for hand in corpus_hands]
+
+
+def test_preflop_sequence_matches_actions(parsed_hands):
+    for parsed in parsed_hands:
+        assert preflop_sequence(parsed) == [x for x, _, _ in parsed.actions_sequence('preflop')]
+
+
+def test_priority_with_package_parser_interface(parsed_hands):
+    for parsed in parsed_hands:
+        assert hand_priority(PackageParser(parsed)) == hand_priority(parsed)
+
+
+def test_priority_with_watcher_parser(corpus_hands):
+    package = pytest.importorskip('poker.parsers.hhparser')
+    for hand in corpus_hands[:200]:
+        hand_priority(package.HHParser(hand))
+
+
+def test_fold_before_shove_is_skipped(parsed_hands):
+    parsed = next(x for x in parsed_hands if x.hid == FOLD_BEFORE_SHOVE)
+    assert parsed.p_ai_players
+    assert faced_all_in(parsed) == []
+    assert hand_priority(parsed) is None
+    assert hand_priority(parsed, skip_folds=False) > PRIORITY_DEFAULT
+
+
+def test_all_in_hands_come_first(parsed_hands):
+    for parsed in parsed_hands:
+        priority = hand_priority(parsed)
+        if parsed.hero in (parsed.p_ai_players or []):
+            assert priority < PRIORITY_DEFAULT
+        elif faced_all_in(parsed):
+            assert priority is not None and priority < PRIORITY_DEFAULT
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from hand_storage import split_hands, BOM
+
+
+def old_split(file):
+    # hand splitting before chunked reading
+    with open(file, encoding='utf-8') as f:
+        return [x.strip() for x in f.read().split('\n\n') if x.strip()]
+
+
+def test_split_matches_old_split(corpus_files):
+    for file in corpus_files:
+        assert [hand for _, hand in split_hands(file)] == old_split(file)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 4096])
+def test_chunk_boundaries(corpus_files, chunk_size):
+    file = corpus_files[0]
+    assert list(split_hands(file, chunk_size=chunk_size)) == list(split_hands(file))
+
+
+def test_crlf_and_bom(corpus_files, tmp_path):
+    file = corpus_files[0]
+    with open(file, 'rb') as f:
+        data = f.read()
+    converted = tmp_path / 'crlf.txt'
+    converted.write_bytes(BOM + data.replace(b'\n', b'\r\n'))
+    assert [hand for _, hand in split_hands(str(converted), chunk_size=50)] == old_split(file)
+
+
+def test_offsets_start_hands(corpus_files):
+    file = corpus_files[1]
+    hands = list(split_hands(file))
+    for offset, hand in hands:
+        assert list(split_hands(file, offset))[0][1] == hand
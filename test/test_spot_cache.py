@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import re
+
+from hhparser import HHParser
+from spot_cache import SpotCache, spot_key
+
+
+def test_equivalent_hand_is_found(corpus_hands):
+    spots = SpotCache()
+    parsed = HHParser(corpus_hands[0])
+    assert spots.get(parsed) is None
+    spots.put(parsed, 'result', 'hrc')
+    result_path, parsed_hrc, names = spots.get(HHParser(corpus_hands[0]))
+    assert (result_path, parsed_hrc) == ('result', 'hrc')
+    assert all(k == v for k, v in names.items())
+
+
+def test_hand_without_level_is_not_cached(corpus_hands):
+    parsed = HHParser(re.sub(r' - Level \S+ \(\d+/\d+\)', '', corpus_hands[0]))
+    assert parsed.bb == 0
+    assert spot_key(parsed) is None
+    spots = SpotCache()
+    spots.put(parsed, 'result', 'hrc')
+    assert spots.get(parsed) is None
+    assert len(spots) == 0
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import bulk_import
+from tournament_stats import TournamentAggregator, aggregate
+
+
+@pytest.fixture(scope='module')
+def records(corpus_files):
+    res = [record for file in corpus_files for _, record in bulk_import.parse_file(file)[0]]
+    # tournaments played at the same time are interleaved
+    return sorted(res, key=lambda x: (x.datetime, x.hid))
+
+
+def totals_by_tid(totals):
+    return {x.tid: x for x in totals}
+
+
+def test_tournaments_complete_on_finish(records):
+    totals = list(aggregate(records))
+    assert len(totals) == len({x.tid for x in records})
+    assert sum(x.hands for x in totals) == len(records)
+    for x in totals:
+        assert not x.partial
+        if x.complete:
+            assert x.hero_place > 0
+
+
+def test_duplicates_are_ignored(records):
+    agg = TournamentAggregator()
+    for record in records[:100] + records[:100]:
+        agg.add(record)
+    assert agg.hands == 100
+    assert agg.duplicates == 100
+
+
+def test_eviction_and_merge(records):
+    full = totals_by_tid(aggregate(records))
+    parts = list(aggregate(records, max_open=2))
+    assert len(parts) > len(full)
+    assert any(x.evicted for x in parts) and any(x.continuation for x in parts)
+
+    merged = {}
+    for x in parts:
+        if x.tid in merged:
+            assert x.continuation
+            merged[x.tid].merge(x)
+        else:
+            assert not x.continuation
+            merged[x.tid] = x
+    assert merged.keys() == full.keys()
+    for tid, x in merged.items():
+        assert x.hands == full[tid].hands
+        assert x.complete == full[tid].complete
+        assert x.as_dict()['players'] == full[tid].as_dict()['players']
+        assert (x.first_hid, x.last_hid) == (full[tid].first_hid, full[tid].last_hid)
+
+
+def test_memory_is_bounded(records):
+    agg = TournamentAggregator(max_open=3, max_closed=5)
+    for record in records:
+        agg.add(record)
+        assert len(agg) <= 3
+        assert len(agg._closed) <= 5
+
+
+class Summary:
+    # TournamentSummary fields
+    def __init__(self, tid, finishes, prize_won):
+        self.tid = str(tid)
+        self.finishes = finishes
+        self.prize_won = prize_won
+
+
+def test_summary_completes_tournament(records):
+    tid = records[0].tid
+    agg = TournamentAggregator()
+    for record in records:
+        if record.tid == tid:
+            agg.add(record)
+            break
+    hero = agg.get(tid).hero
+    totals = agg.add_summary(Summary(tid, 2, {hero: 5.5}))
+    assert totals.complete and not totals.partial
+    assert (totals.hero_place, totals.hero_prize, totals.hero_itm) == (2, 5.5, True)
+    # summary of completed tournament is ignored
+    assert agg.add_summary(Summary(tid, 2, {hero: 5.5})) is None
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Tournament totals aggregated from a stream of parsed hands.
+
+Hands are grouped by tournament id, every hand updates totals of its tournament:
+hands played, bounties, prizes, places and chips collected by blind level of every player.
+A tournament is complete when the winner or hero finishes (hero history ends there),
+its totals are returned by the call that added the hand. Hand ids are monotonic within
+a tournament, hands with id not greater than the last one are duplicates and are ignored.
+Only max_open tournaments are kept open, the least recently updated one is returned
+incomplete (evicted) when the limit is exceeded, later hands of it are returned as
+continuation totals, parts are combined with TournamentTotals.merge.
+"""
+import logging
+from collections import OrderedDict
+
+from hand_record import HandRecord
+
+logger = logging.getLogger(__name__)
+
+MAX_OPEN = 1000
+# ids of completed tournaments remembered to ignore their late hands
+MAX_CLOSED = 10000
+
+
+def _as_dict(pairs):
+    return dict(pairs) if pairs else {}
+
+
+class PlayerTotals:
+    """
+    totals of one player in a tournament
+    chips_won - dict {(sb, bb): chips collected from pots at the level}
+    """
+    __slots__ = ('hands', 'bounty_won', 'prize_won', 'place', 'chips_won')
+
+    def __init__(self):
+        self.hands = 0
+        self.bounty_won = 0.0
+        self.prize_won = 0.0
+        # 0 while the player is in the tournament or place is unknown
+        self.place = 0
+        self.chips_won = {}
+
+    @property
+    def itm(self):
+        return self.prize_won > 0
+
+    @property
+    def chips_total(self):
+        return sum(self.chips_won.values())
+
+    def as_dict(self):
+        return {'hands': self.hands, 'bounty_won': self.bounty_won, 'prize_won': self.prize_won,
+                'place': self.place, 'itm': self.itm, 'chips_won': dict(self.chips_won)}
+
+
+class TournamentTotals:
+    """
+    totals of a tournament, players - dict {player: PlayerTotals}
+    """
+
+    def __init__(self, tid, bi=None, bounty=None, rake=None):
+        self.tid = tid
+        self.bi = bi
+        self.bounty = bounty
+        self.rake = rake
+        self.hero = None
+        self.hands = 0
+        self.first_hid = None
+        self.last_hid = None
+        self.start = None
+        self.end = None
+        self.players = {}
+        # winner or hero finished or summary was added
+        self.complete = False
+        # returned before the last hand to keep max_open limit
+        self.evicted = False
+        # started after totals of the tournament were returned, hands before first_hid are in other totals
+        self.continuation = False
+
+    def __str__(self):
+        return (f"Tournament: #{self.tid} Hands: {self.hands} Finish: {self.hero_place} "
+                f"Prize: {self.hero_prize} Bounty: {self.hero_bounty}")
+
+    @property
+    def partial(self):
+        return self.evicted or self.continuation
+
+    def player(self, name):
+        totals = self.players.get(name)
+        if totals is None:
+            totals = self.players[name] = PlayerTotals()
+        return totals
+
+    def _hero_totals(self):
+        return self.players.get(self.hero) if self.hero is not None else None
+
+    @property
+    def hero_place(self):
+        hero = self._hero_totals()
+        return hero.place if hero else 0
+
+    @property
+    def hero_prize(self):
+        hero = self._hero_totals()
+        return hero.prize_won if hero else 0.0
+
+    @property
+    def hero_bounty(self):
+        hero = self._hero_totals()
+        return hero.bounty_won if hero else 0.0
+
+    @property
+    def hero_itm(self):
+        return self.hero_prize > 0
+
+    @property
+    def total_bounty(self):
+        return sum(x.bounty_won for x in self.players.values())
+
+    @property
+    def total_prize(self):
+        return sum(x.prize_won for x in self.players.values())
+
+    def add(self, record):
+        """
+        adds totals of the hand
+        :param record: HandRecord
+        """
+        if self.first_hid is None:
+            self.first_hid = record.hid
+            self.start = record.datetime
+        self.last_hid = record.hid
+        self.end = record.datetime
+        self.hands += 1
+        if self.bi is None:
+            self.bi, self.bounty, self.rake = record.bi, record.bounty, record.rake
+        players = record.players
+        if record.hero >= 0:
+            self.hero = players[record.hero]
+
+        for name in players:
+            self.player(name).hands += 1
+
+        level = (record.sb, record.bb)
+        for seat, chips in _as_dict(record.chip_won).items():
+            if seat >= 0:
+                won = self.player(players[seat]).chips_won
+                won[level] = won.get(level, 0) + sum(chips)
+        for seat, bounty in _as_dict(record.bounty_won).items():
+            if seat >= 0:
+                self.player(players[seat]).bounty_won += bounty
+        for seat, prize in _as_dict(record.prize_won).items():
+            if seat >= 0:
+                self.player(players[seat]).prize_won += prize
+        for seat, place in _as_dict(record.finishes).items():
+            if seat >= 0 and place:
+                self.player(players[seat]).place = place
+                if place == 1 or seat == record.hero:
+                    self.complete = True
+
+    def merge(self, other):
+        """
+        adds totals of the next part of the same tournament
+        :param other: TournamentTotals with hands after last_hid of this one
+        """
+        if self.first_hid is None:
+            self.first_hid, self.start = other.first_hid, other.start
+        if other.last_hid is not None:
+            self.last_hid, self.end = other.last_hid, other.end
+        if self.bi is None:
+            self.bi, self.bounty, self.rake = other.bi, other.bounty, other.rake
+        self.hero = self.hero if other.hero is None else other.hero
+        self.hands += other.hands
+        for name, x in other.players.items():
+            totals = self.player(name)
+            totals.hands += x.hands
+            totals.bounty_won += x.bounty_won
+            # prize is won once, summary prize may be in both parts
+            totals.prize_won = max(totals.prize_won, x.prize_won)
+            totals.place = x.place or totals.place
+            for level, chips in x.chips_won.items():
+                totals.chips_won[level] = totals.chips_won.get(level, 0) + chips
+        self.complete = other.complete
+        self.evicted = other.evicted
+
+    def add_summary(self, summary):
+        """
+        replaces prizes and hero place with values of tournament summary, summary prizes are final
+        :param summary: TournamentSummary
+        """
+        for name, prize in (summary.prize_won or {}).items():
+            self.player(name).prize_won = prize
+        if summary.finishes and self.hero is not None:
+            self.player(self.hero).place = summary.finishes
+        self.complete = True
+
+    def as_dict(self):
+        return {'tid': self.tid, 'bi': self.bi, 'bounty': self.bounty, 'rake': self.rake, 'hero': self.hero,
+                'hands': self.hands, 'first_hid': self.first_hid, 'last_hid': self.last_hid,
+                'start': self.start, 'end': self.end, 'complete': self.complete,
+                'evicted': self.evicted, 'continuation': self.continuation,
+                'players': {k: v.as_dict() for k, v in self.players.items()}}
+
+
+class TournamentAggregator:
+    """
+    usage:
+    agg = TournamentAggregator()
+    for parsed_hand in hands:
+        for totals in agg.add(parsed_hand):
+            report(totals)
+    for totals in agg.flush():
+        report(totals)
+    """
+
+    def __init__(self, max_open=MAX_OPEN, max_closed=MAX_CLOSED):
+        """
+        :param max_open: maximal number of tournaments waiting for their last hand
+        :param max_closed: number of completed tournament ids remembered to ignore their late hands
+        """
+        self.max_open = max_open
+        self.max_closed = max_closed
+        self.hands = 0
+        self.duplicates = 0
+        self.tournaments = 0
+        self.evicted = 0
+        # tid -> TournamentTotals, least recently updated first
+        self._open = OrderedDict()
+        # tid -> (last hand id, complete) of returned tournament
+        self._closed = OrderedDict()
+
+    def __len__(self):
+        return len(self._open)
+
+    def get(self, tid):
+        """
+        :return: TournamentTotals of open tournament or None
+        """
+        return self._open.get(int(tid))
+
+    def _close(self, totals):
+        self.tournaments += 1
+        self._closed[totals.tid] = (totals.last_hid, totals.complete)
+        self._closed.move_to_end(totals.tid)
+        while len(self._closed) > self.max_closed:
+            self._closed.popitem(last=False)
+        return totals
+
+    def add(self, record):
+        """
+        adds hand to totals of its tournament
+        :param record: HandRecord or HHParser
+        :return: list of TournamentTotals completed by the hand or evicted to keep max_open limit,
+            hands of evicted tournament are added to new totals with continuation set, both parts are partial
+        """
+        if not isinstance(record, HandRecord):
+            record = HandRecord.from_parser(record)
+        tid = record.tid
+        res = []
+
+        totals = self._open.get(tid)
+        if totals is None:
+            closed = self._closed.get(tid)
+            if closed is not None and (closed[0] is None or record.hid <= closed[0]):
+                self.duplicates += 1
+                return res
+            totals = self._open[tid] = TournamentTotals(tid)
+            totals.continuation = closed is not None
+        elif record.hid <= totals.last_hid:
+            self.duplicates += 1
+            return res
+        self._open.move_to_end(tid)
+
+        totals.add(record)
+        self.hands += 1
+        if totals.complete:
+            res.append(self._close(self._open.pop(tid)))
+
+        while len(self._open) > self.max_open:
+            _, evicted = self._open.popitem(last=False)
+            logger.debug(f'tournament {evicted.tid} evicted after {evicted.hands} hands')
+            evicted.evicted = True
+            self.evicted += 1
+            res.append(self._close(evicted))
+        return res
+
+    def add_summary(self, summary):
+        """
+        completes tournament with final prizes of the summary
+        :param summary: TournamentSummary
+        :return: TournamentTotals, continuation if tournament was evicted, None if it is already completed
+        """
+        tid = int(summary.tid)
+        totals = self._open.pop(tid, None)
+        if totals is None:
+            closed = self._closed.get(tid)
+            if closed is not None and closed[1]:
+                return None
+            # tournament without hands in the stream or evicted one
+            totals = TournamentTotals(tid)
+            totals.continuation = closed is not None
+        totals.add_summary(summary)
+        return self._close(totals)
+
+    def flush(self):
+        """
+        :return: list of TournamentTotals of all open tournaments, they are incomplete
+        """
+        res = [self._close(totals) for totals in self._open.values()]
+        self._open.clear()
+        return res
+
+
+def aggregate(hands, max_open=MAX_OPEN):
+    """
+    :param hands: iterable of HandRecord or HHParser
+    :return: generator of TournamentTotals in order of completion, incomplete tournaments are the last
+    """
+    agg = TournamentAggregator(max_open)
+    for hand in hands:
+        yield from agg.add(hand)
+    yield from agg.flush()
@@ -1,14 +1,56 @@
 import os
-import time
+import dirwatch
 from hrc import HRCAuto
+from hrc_pool import HRCPool
+from hand_storage import HandTail, HandStoragePgsql, FollowPosition, hand_row, result_row
+from hand_index import HandIndex, hand_ids
+from spot_cache import SpotCache
+from scheduler import hand_priority
+from pipeline import Stage, Task
 from poker.parsers.hhparser import HHParser
 from poker.parsers.hrcparser import HRCParser
+import itertools
 import logging
-from queue import PriorityQueue
+import time
+import psycopg2
+from queue import PriorityQueue, Queue
+from functools import partial
 from threading import Thread
 
 SEARCH_DIR = '/mnt/hands'
 RESULT_DIR = os.path.expanduser('~/1results')
+# hands failed in all attempts
+DEAD_LETTER_DIR = os.path.join(RESULT_DIR, 'failed')
+# poll directory instead of inotify, e.g. for network mounts where files are written by other hosts
+POLLING = False
+# seconds between scans of polled directory
+POLL_INTERVAL = 2.0
+# more than 1 runs HRC instances on virtual displays
+HRC_INSTANCES = 1
+# hands queued together are calculated in one HRC session
+BATCH_SIZE = 10
+# hands where hero folded preflop are not calculated
+SKIP_FOLDS = True
+# sizes of queues between stages, full queue blocks the previous stage
+CALC_QUEUE_SIZE = 1000
+RESULT_QUEUE_SIZE = 100
+# hands saved to PostgreSQL at once
+WRITE_BATCH = 100
+# calculated hands waiting for PostgreSQL, they are kept while database is unavailable
+DB_QUEUE_SIZE = 10000
+# attempts to save hands to PostgreSQL and seconds between them, one hour in total
+DB_MAX_ATTEMPTS = 60
+DB_RETRY_DELAY = 60
+# connection parameters of HandStoragePgsql to save results to PostgreSQL, e.g.
+# {'dbname': 'hrc', 'user': 'hrc', 'host': 'localhost', 'port': 5432, 'pwd': ''}
+PGSQL = None
+# hands inserted into handhistory table of PGSQL database are calculated too
+WATCH_PGSQL = False
+# seconds between reconnects to PGSQL database
+DB_RECONNECT_DELAY = 10
+
+# order of hands with the same priority
+_sequence = itertools.count()
 
 
 def configure_logger():
@@ -22,61 +64,153 @@ def configure_logger():
     return logger
 
 
-def watch_directory(path: str, out_q: PriorityQueue):
-    PRIORITY = 1
-    dir_contents = set(os.listdir(SEARCH_DIR))
+def watch_directory(path: str, out_q: PriorityQueue, index: HandIndex):
+    tail = HandTail()
+    watcher = dirwatch.create_watcher(path, interval=POLL_INTERVAL, polling=POLLING)
+    logger.info(f'Watching {path} with {type(watcher).__name__}')
+    # files changed while watcher was stopped are read again, calculated hands are skipped by index,
+    # hands written before the first start are not processed
+    checkpoint = index.checkpoint()
+    for file, (mtime, size) in dirwatch.scan(path).items():
+        if checkpoint is None or mtime < checkpoint * 1e9:
+            tail.seek(file, size)
+        else:
+            for offset, history in tail.read(file, final=True):
+                queue_hand(out_q, index, file, offset, history)
 
-    while True:
-        time.sleep(2)
-        current_dir_contents = set(os.listdir(SEARCH_DIR))
-        diff = current_dir_contents - dir_contents
-        if diff:
-            for d in diff:
-                dir_contents = set(os.listdir(SEARCH_DIR))
-                out_q.put((PRIORITY, os.path.join(SEARCH_DIR, d)))
+    for event, file in watcher.events():
+        # only new hands are queued, the last hand is held back until it is written completely
+        if event not in (dirwatch.MODIFY, dirwatch.CLOSE_WRITE):
+            continue
+        try:
+            hands = tail.read(file, final=event == dirwatch.CLOSE_WRITE)
+        except OSError as e:
+            logger.error(e)
+            tail.forget(file)
+            continue
+        for offset, history in hands:
+            queue_hand(out_q, index, file, offset, history)
 
 
-def process_files(in_q: PriorityQueue):
-    calc = HRCAuto()
+def watch_database(storage: HandStoragePgsql, out_q: PriorityQueue, index: HandIndex):
+    logger.info('Watching handhistory table')
+    # hands inserted after start, reading continues from this position after reconnect
+    position = FollowPosition()
     while True:
-        _, file = in_q.get()
-        for history in read_hh_files(file):
-            parsed_hand = HHParser(history)
-            logger.info(f'Hand received: {parsed_hand} {parsed_hand.hero_cards}')
-            fn = os.path.join(RESULT_DIR, '-'.join([parsed_hand.tid, parsed_hand.hid, parsed_hand.hero_cards]))
-            # calculate and save html file fn with results
-            saved = False
-            while not saved:
-                calc.calculate_basic(parsed_hand.hand_history, fn)
-                saved = os.path.exists(fn + '.html')
-                logger.debug(('saved', saved, fn))
-
-            try:
-                parsed_hrc = parse_hrc_output(fn)
-                logger.info(get_hero_ev(parsed_hrc, parsed_hand))
-                logger.info(get_ranges(parsed_hrc, parsed_hand))
-
-            except (FileNotFoundError, IndexError) as e:
-                logger.error(e)
-                continue
-
-
-def read_hh_files(file):
-    with open(file, encoding='utf-8') as f:
         try:
-            s = f.read()
-            s = s.split('\n\n')
-            for ss in s:
-                if ss == '\n\n' or ss == None or ss == '':
-                    continue
-                yield ss
-
-        except Exception as e:
-            logger.error(e)
+            for hh_id, history in storage.follow_hands(position=position):
+                queue_hand(out_q, index, 'handhistory', hh_id, history)
+        except psycopg2.Error as e:
+            logger.error(f'Handhistory reading error, reconnecting in {DB_RECONNECT_DELAY} s: {e}')
+            time.sleep(DB_RECONNECT_DELAY)
+
+
+def queue_hand(out_q, index, file, offset, history):
+    # hand is parsed before queueing to get its priority
+    hid, tid = hand_ids(history)
+    if hid is None:
+        logger.error(f'Hand id not found: {file} {offset}')
+        return
+    if index.is_done(hid):
+        logger.debug(f'Hand {hid} is already calculated')
+        return
+
+    try:
+        parsed_hand = HHParser(history)
+        priority = hand_priority(parsed_hand, SKIP_FOLDS)
+    except Exception as e:
+        logger.error(f'Hand parsing error: {file} {offset} {e!r}')
+        return
+
+    if priority is None:
+        logger.debug(f'Hand {hid} is skipped')
+        index.skip(hid, tid)
+    elif index.queue(hid, tid):
+        # blocks when calculation queue is full
+        out_q.put(Task(priority, next(_sequence), parsed_hand))
+
+
+def result_name(parsed_hand):
+    # path of hrc output without extension
+    return os.path.join(RESULT_DIR, '-'.join([parsed_hand.tid, parsed_hand.hid, parsed_hand.hero_cards]))
+
 
+def calculate_hands(tasks, calc, spots):
+    # GUI stage, hands of spots calculated before are taken from cache, other hands are calculated in one batch
+    results = []
+    batch = []
+    for task in tasks:
+        parsed_hand = task.hand
+        logger.info(f'Hand received: {parsed_hand} {parsed_hand.hero_cards} priority {task.priority:.2f}')
+        cached = spots.get(parsed_hand)
+        if cached is not None:
+            task.result_path, task.parsed_hrc, task.names = cached
+            task.cached = True
+            logger.info(f'Spot found in cache: {task.result_path}')
+            results.append((task, None))
+        else:
+            batch.append(task)
 
-def update_index():
-    pass
+    if batch:
+        # calculate and save html files with results
+        saved = calc.calculate_batch([(task.hand.hand_history, result_name(task.hand)) for task in batch])
+        for task in batch:
+            fn = result_name(task.hand)
+            if saved[fn]:
+                task.result_path = fn + '.html'
+                results.append((task, None))
+            else:
+                results.append((task, RuntimeError(f'Result is not saved: {fn}')))
+    return results
+
+
+def parse_results(tasks):
+    results = []
+    for task in tasks:
+        try:
+            if task.parsed_hrc is None:
+                task.parsed_hrc = parse_hrc_output(os.path.splitext(task.result_path)[0])
+            # IndexError is raised if hand is not found in hrc output
+            task.hero_ev = get_hero_ev(task.parsed_hrc, task.hand, task.names)
+            task.ranges = get_ranges(task.parsed_hrc, task.hand, task.names)
+            results.append((task, None))
+        except (OSError, IndexError) as e:
+            results.append((task, e))
+    return results
+
+
+def persist_results(tasks, index, spots):
+    # hands are marked done before database writing, database errors don't cause calculation again
+    for task in tasks:
+        logger.info(task.hero_ev)
+        logger.info(task.ranges)
+        index.done(task.hand.hid, task.result_path, task.hero_ev[2] if task.hero_ev else None)
+        if not task.cached:
+            spots.put(task.hand, task.result_path, task.parsed_hrc)
+    return [(task, None) for task in tasks]
+
+
+def write_database(tasks, storage):
+    # all tasks already queued are written to database in one batch
+    storage.write_results([hand_row(task.hand) for task in tasks],
+                          [result_row(task.hand, task.hero_ev, task.ranges, task.result_path) for task in tasks])
+    return [(task, None) for task in tasks]
+
+
+def dead_letter(index, task, stage, error):
+    # hand failed in all attempts is saved with the error for manual check,
+    # index is None for hands which are already calculated
+    parsed_hand = task.hand
+    os.makedirs(DEAD_LETTER_DIR, exist_ok=True)
+    fn = os.path.join(DEAD_LETTER_DIR, f'{parsed_hand.tid}-{parsed_hand.hid}.txt')
+    try:
+        with open(fn, 'w') as f:
+            f.write(f'{stage}: {error!r}\n\n{parsed_hand.hand_history}\n')
+    except OSError as e:
+        logger.error(e)
+    if index is not None:
+        index.failed(parsed_hand.hid, f'{stage}: {error!r}')
+    logger.error(f'Hand {parsed_hand.hid} failed in {stage}: {error!r}, saved to {fn}')
 
 
 def parse_hrc_output(fn):
@@ -85,17 +219,24 @@ def parse_hrc_output(fn):
     return HRCParser(html)
 
 
-def get_hero_ev(parsed_hrc, parsed_hand):
+def get_strategy(players_list, hero, names=None):
+    # players acted before hero and hero, names translates players to players of hrc output
+    names = names or {}
+    return ','.join(names.get(x, x) for x in players_list[:players_list.index(hero) + 1])
+
+
+def get_hero_ev(parsed_hrc, parsed_hand, names=None):
     """
     determines hero from parsed hand and gets ev of played hand from hrc output
     :param parsed_hrc:
     :param parsed_hand:
+    :param names: dict {player: player in hrc output} if output was calculated for another hand with the same spot
     :return: tuple (hand, strategy, ev)
     """
     players_list = get_active_players(parsed_hand)
     logger.debug(players_list)
     if parsed_hand.hero in players_list:
-        strategy = ','.join(players_list[:players_list.index(parsed_hand.hero) + 1])
+        strategy = get_strategy(players_list, parsed_hand.hero, names)
         logger.debug(strategy)
         hand = parsed_hand.cards_to_hand(parsed_hand.hero_cards)
         return (hand, strategy, parsed_hrc.get_hand_ev(hand, strategy))
@@ -107,21 +248,47 @@ def get_active_players(parsed_hand):
     return [k for k, v in parsed_hand.p_actions.items() if v != ['f'] or k == parsed_hand.hero]
 
 
-def get_ranges(parsed_hrc, parsed_hand):
+def get_ranges(parsed_hrc, parsed_hand, names=None):
     players_list = get_active_players(parsed_hand)
     if parsed_hand.hero in players_list:
-        strategy = ','.join(players_list[:players_list.index(parsed_hand.hero) + 1])
+        strategy = get_strategy(players_list, parsed_hand.hero, names)
         return parsed_hrc.get_range(strategy)
 
 
 if __name__ == '__main__':
 
     logger = configure_logger()
-    q = PriorityQueue()
-    producer = Thread(target=watch_directory, args=(SEARCH_DIR, q, ))
-    consumer = Thread(target=process_files, args=(q, ))
-    producer.start()
-    consumer.start()
+    index = HandIndex()
+    spots = SpotCache()
+    calc_q = PriorityQueue(CALC_QUEUE_SIZE)
+    result_q = Queue(RESULT_QUEUE_SIZE)
+    persist_q = Queue(RESULT_QUEUE_SIZE)
+    db_q = Queue(DB_QUEUE_SIZE)
+    dead = partial(dead_letter, index)
+    storage = None
+    if PGSQL:
+        storage = HandStoragePgsql(**PGSQL)
+        storage.create_tables()
 
+    if HRC_INSTANCES > 1:
+        # every instance takes the next hands from the queue when it is free
+        pool = HRCPool(HRC_INSTANCES)
+        instances = pool.start()
+    else:
+        instances = [HRCAuto()]
 
+    # parsing is done by producer, calculation by one thread per HRC instance, result parsing and saving
+    # run in their own threads so HRC doesn't wait for them
+    Stage('calculate', partial(calculate_hands, spots=spots), calc_q, result_q, dead, BATCH_SIZE).start(
+        len(instances), [(calc, ) for calc in instances])
+    Stage('parse results', parse_results, result_q, persist_q, dead).start()
+    Stage('persist', partial(persist_results, index=index, spots=spots), persist_q,
+          db_q if storage is not None else None, dead, WRITE_BATCH).start()
+    if storage is not None:
+        Stage('write database', partial(write_database, storage=storage), db_q, dead_letter=partial(dead_letter, None),
+              batch_size=WRITE_BATCH, max_attempts=DB_MAX_ATTEMPTS, retry_delay=DB_RETRY_DELAY).start()
 
+    producer = Thread(target=watch_directory, args=(SEARCH_DIR, calc_q, index))
+    producer.start()
+    if storage is not None and WATCH_PGSQL:
+        Thread(target=watch_database, args=(storage, calc_q, index)).start()
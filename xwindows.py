@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Window queries over one persistent X11 connection.
+
+Replaces xprop and wmctrl subprocesses of HRCAuto: active window title,
+window lookup by title and activation through EWMH properties.
+Requires python-xlib, HRCAuto falls back to xprop/wmctrl without it.
+"""
+import logging
+
+try:
+    from Xlib import X, display as xdisplay, error as xerror, protocol
+except ImportError:
+    xdisplay = None
+
+logger = logging.getLogger(__name__)
+
+
+class XWindows:
+
+    def __init__(self, display=None):
+        """
+        :param display: X display like ':10', DISPLAY environment variable if None
+        """
+        if xdisplay is None:
+            raise ImportError('python-xlib is required for XWindows')
+        self.display_name = display
+        self._connect()
+
+    def _connect(self):
+        self._display = xdisplay.Display(self.display_name)
+        self._root = self._display.screen().root
+        atom = self._display.intern_atom
+        self._net_active_window = atom('_NET_ACTIVE_WINDOW')
+        self._net_client_list = atom('_NET_CLIENT_LIST')
+        self._net_wm_name = atom('_NET_WM_NAME')
+        self._utf8_string = atom('UTF8_STRING')
+
+    def _call(self, func, *args):
+        # windows may be closed between calls, connection is restored once if X server closed it
+        try:
+            return func(*args)
+        except xerror.ConnectionClosedError as e:
+            logger.error(f'X connection closed: {e}')
+            self._connect()
+            return func(*args)
+
+    def close(self):
+        self._display.close()
+
+    def _window(self, wid):
+        return self._display.create_resource_object('window', wid)
+
+    def _title(self, wid):
+        try:
+            window = self._window(wid)
+            prop = window.get_full_property(self._net_wm_name, self._utf8_string)
+            if prop is not None and prop.value:
+                return prop.value.decode('utf-8', errors='replace')
+            name = window.get_wm_name()
+            return name.decode('latin-1') if isinstance(name, bytes) else name
+        except xerror.XError:
+            return None
+
+    def _active_window(self):
+        prop = self._root.get_full_property(self._net_active_window, X.AnyPropertyType)
+        return prop.value[0] if prop is not None and len(prop.value) and prop.value[0] else None
+
+    def _windows(self):
+        prop = self._root.get_full_property(self._net_client_list, X.AnyPropertyType)
+        return list(prop.value) if prop is not None else []
+
+    def active_title(self):
+        """
+        :return: title of the active window or None
+        """
+        def title():
+            wid = self._active_window()
+            return self._title(wid) if wid else None
+        return self._call(title)
+
+    def find(self, title):
+        """
+        finds window by substring of the title like wmctrl -R
+        :return: window id or None
+        """
+        def find():
+            for wid in self._windows():
+                name = self._title(wid)
+                if name is not None and title in name:
+                    return wid
+            return None
+        return self._call(find)
+
+    def activate(self, title):
+        """
+        activates window with title like wmctrl -R
+        :return: True if window was found
+        """
+        def activate():
+            wid = self.find(title)
+            if wid is None:
+                return False
+            # source indication 2: request from a pager, window managers don't ignore it
+            event = protocol.event.ClientMessage(window=self._window(wid), client_type=self._net_active_window,
+                                                 data=(32, [2, X.CurrentTime, 0, 0, 0]))
+            self._root.send_event(event, event_mask=X.SubstructureRedirectMask | X.SubstructureNotifyMask)
+            self._display.flush()
+            return True
+        return self._call(activate)